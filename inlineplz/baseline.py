@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+"""
+Only report the messages a pull request introduces.
+
+The PR's base commit is linted once in a temporary worktree and the results are cached
+by base commit, so every PR targeting that commit shares one run. Base messages are
+shifted through the PR's diff to their line numbers at head, and head messages that
+match one are dropped.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+
+from inlineplz import __version__
+from inlineplz import linters
+from inlineplz import message
+from inlineplz.util import git, lintcache, system
+
+
+def cache_key(sha, args):
+    """
+    Key base results by commit, everything else that decides which linters run and the
+    versions of the linters installed here.
+    """
+    config_files = {}
+    if args.config_dir and os.path.isdir(args.config_dir):
+        for root, _, filenames in os.walk(args.config_dir):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, args.config_dir)
+                config_files[name] = linters.content_hash(path)
+    # linters installed while linting don't have a version yet, the rest would find
+    # different messages after an upgrade
+    enabled = set(",".join(args.enabled_linters or []).split(",")) - {""}
+    disabled = set(",".join(args.disabled_linters or []).split(","))
+    versions = {
+        linter: linters.linter_version(config, args.config_dir)["version"]
+        for linter, config in linters.LINTERS.items()
+        if (not enabled or linter in enabled) and linter not in disabled
+    }
+    return lintcache.make_key(
+        "baseline",
+        sha,
+        sorted(args.enabled_linters or []),
+        sorted(args.disabled_linters or []),
+        sorted(args.ignore_paths or []),
+        bool(args.autorun),
+        config_files,
+        versions,
+        __version__,
+    )
+
+
+def lint_commit(sha, lint, failures=None):
+    """
+    Call lint(failures) in a worktree of sha and return its messages as (path, line,
+    comment), with comments as the linters wrote them.
+    """
+    cwd = os.getcwd()
+    # linters installed into the worktree are gone once we're back, so head has to
+    # install them again
+    previous_installs = list(linters.PREVIOUS_INSTALL_COMMANDS)
+    with git.worktree(sha) as path:
+        os.chdir(path)
+        try:
+            messages = lint(failures)
+        finally:
+            os.chdir(cwd)
+            linters.PREVIOUS_INSTALL_COMMANDS[:] = previous_installs
+    return [
+        [msg.path, msg.line_number, msg.originals.get(comment, comment)]
+        for msg in messages
+        for comment in sorted(msg.comments)
+    ]
+
+
+def load(sha, diff_index, cache, key, lint):
+    """
+    Return the Baseline for sha, from cache or by linting it with lint(failures), which
+    adds the linters that failed to the failures list.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        print("Reusing baseline results for {0}".format(sha))
+        return Baseline(entry["messages"], diff_index)
+
+    print("Linting base commit {0} for the baseline".format(sha))
+    failures = []
+    messages = lint_commit(sha, lint, failures)
+    # every PR on this base would reuse a partial baseline
+    if failures:
+        print("Not caching the baseline, {0} failed".format(", ".join(failures)))
+    elif not system.should_stop():
+        cache.set(key, {"sha": sha, "messages": messages})
+    return Baseline(messages, diff_index)
+
+
+class Baseline(object):
+    def __init__(self, messages, diff_index):
+        """
+        Messages found at the base commit, as (path, line, comment), moved to where their
+        lines are at head. Messages on lines the PR removed or rewrote are left out.
+
+        Head comments have their head line number normalized away, so a base comment
+        matches in either form: with its own line number or the head one normalized.
+        """
+        self.diff_index = diff_index
+        self.known = set()
+        count = 0
+        for path, line, comment in messages:
+            shifted = diff_index.map_line(path, line)
+            if shifted:
+                count += 1
+                for normalized in (
+                    message.normalize(comment, line),
+                    message.normalize(comment, shifted[1]),
+                ):
+                    self.known.add((shifted[0], shifted[1], normalized))
+        print("Baseline has {0} messages".format(count))
+
+    def changed_files(self):
+        return set(self.diff_index.files)
+
+    def new_messages(self, messages):
+        """Return copies of messages without the comments the base commit already had."""
+        new = []
+        for msg in messages:
+            comments = {
+                comment
+                for comment in msg.comments
+                if (msg.path, msg.line_number, comment) not in self.known
+            }
+            if comments:
+                new_msg = msg.copy()
+                new_msg.comments = comments
+                new.append(new_msg)
+        return new
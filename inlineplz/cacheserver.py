@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+"""
+Reference server for --remote-cache.
+
+Stores each PUT /<key> body in a file and serves it back on GET /<key>. Once the store
+grows past --max-size, the least recently read or written entries are removed first.
+
+    inline-plz-cache-server --path /var/cache/inlineplz --port 8080
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import os
+import re
+import tempfile
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+# keys are hex digests, which also keeps requests from escaping the store
+KEY_RE = re.compile(r"^[0-9a-f]{16,128}$")
+DEFAULT_MAX_SIZE = 1024**3
+
+
+class CacheStore(object):
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE):
+        """Files under path, one per key, capped at max_size bytes in total."""
+        self.path = path
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.size = sum(os.path.getsize(filename) for filename in self.entries())
+
+    def _filename(self, key):
+        return os.path.join(self.path, key)
+
+    def entries(self):
+        return [
+            os.path.join(self.path, name)
+            for name in os.listdir(self.path)
+            if KEY_RE.match(name)
+        ]
+
+    def get(self, key):
+        try:
+            with open(self._filename(key), "rb") as entry:
+                data = entry.read()
+            # mark as recently used
+            os.utime(self._filename(key), None)
+            return data
+
+        except (IOError, OSError):
+            return None
+
+    def put(self, key, data):
+        handle, tmp_path = tempfile.mkstemp(dir=self.path, prefix=".tmp")
+        with os.fdopen(handle, "wb") as entry:
+            entry.write(data)
+        with self.lock:
+            filename = self._filename(key)
+            if os.path.isfile(filename):
+                self.size -= os.path.getsize(filename)
+            os.replace(tmp_path, filename)
+            self.size += len(data)
+            self.evict()
+
+    def evict(self):
+        if self.size <= self.max_size:
+            return
+
+        for filename in sorted(self.entries(), key=os.path.getmtime):
+            if self.size <= self.max_size:
+                return
+
+            try:
+                size = os.path.getsize(filename)
+                os.remove(filename)
+                self.size -= size
+            except OSError:
+                pass
+
+
+class CacheRequestHandler(BaseHTTPRequestHandler):
+    # set by make_server
+    store = None
+
+    def key(self):
+        key = self.path.split("?", 1)[0].rstrip("/").rsplit("/", 1)[-1]
+        if not KEY_RE.match(key):
+            self.send_error(400, "Invalid cache key")
+            return None
+
+        return key
+
+    def do_GET(self):
+        key = self.key()
+        if not key:
+            return
+
+        data = self.store.get(key)
+        if data is None:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_PUT(self):
+        key = self.key()
+        if not key:
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > self.store.max_size:
+            self.send_error(413)
+            return
+
+        self.store.put(key, self.rfile.read(length))
+        self.send_response(204)
+        self.end_headers()
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_server(path, host="", port=8080, max_size=DEFAULT_MAX_SIZE):
+    handler = type(
+        str("BoundCacheRequestHandler"),
+        (CacheRequestHandler,),
+        {"store": CacheStore(path, max_size)},
+    )
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--path", required=True, help="directory to store entries in")
+    parser.add_argument("--host", default="", help="address to listen on")
+    parser.add_argument("--port", default=8080, type=int)
+    parser.add_argument(
+        "--max-size",
+        default=DEFAULT_MAX_SIZE // 1024**2,
+        type=int,
+        help="megabytes to keep before evicting the least recently used entries",
+    )
+    args = parser.parse_args()
+    server = make_server(args.path, args.host, args.port, args.max_size * 1024**2)
+    print("Serving {0} on port {1}".format(args.path, server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
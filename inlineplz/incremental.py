@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""
+Review a pull request incrementally, starting from the last commit we reviewed.
+
+Complete results are cached per commit. When the interface tells us an earlier commit of
+the pull request was reviewed and we still have its results, per-file linters only lint
+files changed since then, and that commit's messages from per-file linters carry over for
+every other file. Whole-repo linters always run, since a change anywhere can affect them.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import subprocess
+
+from inlineplz import baseline
+from inlineplz import linters
+from inlineplz import message
+from inlineplz.util import git, lintcache
+
+
+def cache_key(sha, args):
+    # --baseline limits per-file linters to the files the PR changed
+    return lintcache.make_key(
+        "review", baseline.cache_key(sha, args), bool(args.__dict__.get("baseline"))
+    )
+
+
+class PreviousReview(object):
+    def __init__(self, sha, messages, changed_files):
+        """
+        The results of reviewing sha, as (path, line, comment), and the files changed
+        between sha and the commit we're reviewing now.
+        """
+        self.sha = sha
+        self.messages = messages
+        self.changed_files = changed_files
+
+    def carried_over(self):
+        """Previous messages from per-file linters on files that haven't changed."""
+        per_file = tuple(
+            "{0}: ".format(name)
+            for name, config in linters.LINTERS.items()
+            if config.get("run_per_file")
+        )
+        return [
+            (path, line, comment)
+            for path, line, comment in self.messages
+            if path not in self.changed_files and comment.startswith(per_file)
+        ]
+
+
+def load(interface, sha, cache, args):
+    """Return the PreviousReview to build on, or None to review everything."""
+    for reviewed_sha in interface.reviewed_shas():
+        entry = cache.get(cache_key(reviewed_sha, args))
+        if entry is None:
+            continue
+
+        if not git.has_commit(reviewed_sha):
+            print("{0} isn't in this clone, reviewing everything".format(reviewed_sha))
+            return None
+
+        try:
+            changed = git.changed_files(reviewed_sha, sha)
+        except subprocess.CalledProcessError:
+            return None
+
+        print(
+            "Building on the review of {0}, {1} files changed since".format(
+                reviewed_sha, len(changed)
+            )
+        )
+        return PreviousReview(reviewed_sha, entry["messages"], changed)
+    return None
+
+
+def merge(messages, carried):
+    """
+    Add carried over (path, line, comment) tuples to messages.
+
+    Returns all messages and the ones the carried over comments ended up in.
+    """
+    merged = message.Messages()
+    for msg in messages:
+        for comment in msg.comments:
+            merged.add_message(msg.path, msg.line_number, comment)
+    updated = merged.add_messages(carried)
+    return list(merged.get_messages()), updated
+
+
+def save(cache, sha, args, messages):
+    """Remember complete results for sha, so a later review can build on them."""
+    cache.set(
+        cache_key(sha, args),
+        {
+            "sha": sha,
+            "messages": [
+                [msg.path, msg.line_number, comment]
+                for msg in messages
+                for comment in sorted(msg.comments)
+            ],
+        },
+    )
@@ -3,6 +3,7 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+from inlineplz.interfaces.checks import ChecksInterface
 from inlineplz.interfaces.github import GitHubInterface
 
-INTERFACES = {"github": GitHubInterface}
+INTERFACES = {"github": GitHubInterface, "checks": ChecksInterface}
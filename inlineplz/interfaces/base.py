@@ -9,7 +9,7 @@ class InterfaceBase(object):
     def start_review(self):
         raise NotImplementedError()
 
-    def finish_review(self, success=True, error=False):
+    def finish_review(self, success=True, error=False, truncated=False):
         raise NotImplementedError()
 
     def is_valid(self):
@@ -23,6 +23,36 @@ class InterfaceBase(object):
         """
         raise NotImplementedError()
 
+    def postable_position(self, msg):
+        """Return where msg would be posted, or None if it wouldn't be."""
+        if not msg.comments:
+            return None
+
+        return msg.line_number
+
+    def reviewed_shas(self):
+        """Yield commits of this review that we finished reviewing, newest first."""
+        return iter(())
+
+    def begin_posting(self, max_comments):
+        """
+        Start a posting session for messages that arrive as each linter finishes.
+
+        Interfaces that can't post incrementally just collect the messages and post them
+        all in end_posting.
+        """
+        self.queued_messages = dict()
+        self.max_comments = max_comments
+
+    def queue_messages(self, messages):
+        for msg in messages:
+            self.queued_messages[(msg.path, msg.line_number)] = msg
+
+    def end_posting(self):
+        return self.post_messages(
+            list(self.queued_messages.values()), self.max_comments
+        )
+
     def clear_outdated_messages(self):
         """
         :return:
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import time
+
+from inlineplz.interfaces.github import (
+    COMPLETE_DESCRIPTION,
+    MAX_REVIEWED_LOOKBACK,
+    GitHubInterface,
+)
+from inlineplz.util import system
+
+CHECK_RUN_NAME = "inline-plz"
+# the checks API takes at most this many annotations per request
+MAX_ANNOTATIONS = 50
+
+
+def timestamp():
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+def finished(check_run):
+    title = (check_run.get("output") or {}).get("title") or ""
+    return check_run.get("status") == "completed" and title.startswith(
+        COMPLETE_DESCRIPTION
+    )
+
+
+class ChecksInterface(GitHubInterface):
+    def __init__(self, *args, **kwargs):
+        """
+        ChecksInterface reports results as a GitHub check run with line annotations.
+
+        It finds the pull request and its diff like GitHubInterface does, but sends up to
+        MAX_ANNOTATIONS messages per request instead of a comment per message, and the
+        check run's conclusion takes the place of the commit status. Annotations don't
+        notify anyone, so max_comments doesn't apply.
+
+        GitHub only lets apps create check runs, so token must be a GitHub App
+        installation token. Personal access and OAuth tokens get a 403.
+        """
+        super(ChecksInterface, self).__init__(*args, **kwargs)
+        self.check_run_url = None
+        self.annotated = dict()
+        self.pending_annotations = []
+
+    def start_review(self):
+        """Create an in progress check run for our commit."""
+        url = self.github_repo._build_url("check-runs", base_url=self.github_repo._api)
+        check_run = self.with_retries(
+            self.send,
+            "post",
+            url,
+            201,
+            {
+                "name": CHECK_RUN_NAME,
+                "head_sha": self.last_sha,
+                "status": "in_progress",
+                "started_at": timestamp(),
+            },
+        )
+        self.check_run_url = check_run["url"]
+
+    def finish_review(self, success=True, error=False, truncated=False):
+        """Complete our check run."""
+        if self.pool:
+            self.pool.close()
+            self.pool = None
+        if self.http_cache:
+            self.http_cache.report()
+        if error:
+            conclusion = "failure"
+            title = "Static analysis error! inline-plz failed to run."
+        elif success:
+            conclusion = "success"
+            title = "Static analysis complete! No errors found in your PR."
+        elif truncated:
+            conclusion = "failure"
+            title = (
+                "Static analysis stopped early! Found errors in your PR, "
+                "results were truncated."
+            )
+        else:
+            conclusion = "failure"
+            title = "Static analysis complete! Found errors in your PR."
+        self.update_check_run(
+            {
+                "status": "completed",
+                "conclusion": conclusion,
+                "completed_at": timestamp(),
+                "output": {"title": title, "summary": self.summary()},
+            }
+        )
+
+    def reviewed_shas(self):
+        """Yield the pull request's commits with a check run of ours that completed."""
+        commits = [commit.sha for commit in self.pr_commits(self.pull_request)]
+        for sha in reversed(commits[-MAX_REVIEWED_LOOKBACK:]):
+            url = self.github_repo._build_url(
+                "commits", sha, "check-runs", base_url=self.github_repo._api
+            )
+            response = self.github_repo._get(url, params={"check_name": CHECK_RUN_NAME})
+            check_runs = (self.github_repo._json(response, 200) or {}).get(
+                "check_runs", []
+            )
+            if any(finished(check_run) for check_run in check_runs):
+                yield sha
+
+    def begin_posting(self, max_comments):
+        self.annotated = dict()
+        self.pending_annotations = []
+        self.posting_done = False
+        if self.out_of_date():
+            print("This run is out of date because the PR has been updated.")
+            self.posting_done = True
+
+    def queue_messages(self, messages):
+        """
+        Annotate postable messages, sending a request whenever a full batch is ready.
+
+        A later linter adding to an annotated line gets a new annotation with just the
+        new comments, since annotations can't be edited.
+        """
+        if self.posting_done:
+            return
+
+        for msg in messages:
+            if not self.postable_position(msg):
+                continue
+
+            key = (msg.path, msg.line_number)
+            comments = msg.comments - self.annotated.get(key, set())
+            if not comments:
+                continue
+
+            self.annotated.setdefault(key, set()).update(comments)
+            self.pending_annotations.append(
+                {
+                    "path": msg.path,
+                    "start_line": msg.line_number,
+                    "end_line": msg.line_number,
+                    "annotation_level": "warning",
+                    "message": "\n".join(sorted(comments)),
+                }
+            )
+            if len(self.pending_annotations) >= MAX_ANNOTATIONS:
+                self.send_annotations()
+
+    def end_posting(self):
+        """Send any remaining annotations and return how many lines were annotated."""
+        if self.pending_annotations and not self.posting_done:
+            self.send_annotations()
+        print("\n{} messages annotated on Github.".format(len(self.annotated)))
+        return len(self.annotated)
+
+    def post_messages(self, messages, max_comments):
+        if not self.github:
+            print("Github connection is invalid.")
+            return
+
+        self.begin_posting(max_comments)
+        self.queue_messages(messages)
+        return self.end_posting()
+
+    def send_annotations(self):
+        if system.should_stop() or self.out_of_date():
+            print("Stopping early.")
+            self.stopped_early = True
+            self.posting_done = True
+            return
+
+        batch = self.pending_annotations[:MAX_ANNOTATIONS]
+        self.pending_annotations = self.pending_annotations[MAX_ANNOTATIONS:]
+        self.update_check_run(
+            {
+                "output": {
+                    "title": "{0} lint messages".format(len(self.annotated)),
+                    "summary": self.summary(),
+                    "annotations": batch,
+                }
+            }
+        )
+        print("Annotations posted successfully: {0}".format(len(batch)))
+
+    def summary(self):
+        return "{0} found {1} messages on lines changed in this PR.".format(
+            self.prefix or CHECK_RUN_NAME, len(self.annotated)
+        )
+
+    def update_check_run(self, data):
+        if not self.check_run_url:
+            print("No check run to update.")
+            return None
+
+        return self.with_retries(self.send, "patch", self.check_run_url, 200, data)
+
+    def send(self, method, url, expected_status, data):
+        self.scheduler.wait()
+        if method == "post":
+            # github3's _post JSON-encodes data itself, _patch sends it as is
+            response = self.github_repo._post(url, data=data)
+        else:
+            response = self.github_repo._patch(url, data=json.dumps(data))
+        return self.github_repo._json(response, expected_status)
+
+    def clear_outdated_messages(self):
+        # every run gets a fresh check run, so there's nothing left over to clean up
+        pass
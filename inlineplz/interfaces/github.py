@@ -4,16 +4,178 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import collections
+import hashlib
+import json
 import random
 import subprocess
+import threading
 import time
 import traceback
+from multiprocessing.pool import ThreadPool as Pool
 
 import github3
-import unidiff
+import requests
+from requests.adapters import HTTPAdapter
 
+from inlineplz.interfaces import github_graphql
 from inlineplz.interfaces.base import InterfaceBase
-from inlineplz.util import git, system
+from inlineplz.util import diff, git, httpcache, ratelimit, system, tokenpool
+
+# keep each batched review request comfortably below GitHub's payload limits
+REVIEW_BATCH_BYTES = 256 * 1024
+# never page through more than this many open pull requests looking for a branch
+MAX_PULL_REQUEST_SCAN = 500
+# how many times a rate limited comment goes back in the queue before we give up on it
+MAX_DEFERRALS = 3
+# what happened to a message we tried to post
+POSTED = "posted"
+REJECTED = "rejected"
+DEFERRED = "deferred"
+# statuses of finished reviews start with this
+COMPLETE_DESCRIPTION = "Static analysis complete!"
+# how many of the newest pull request commits to check for a finished review
+MAX_REVIEWED_LOOKBACK = 10
+
+
+class FreshnessChecker(object):
+    def __init__(self, session, url, sha, interval, head_sha=None, etag=None):
+        """
+        Check whether a pull request's head still matches the commit we're reviewing.
+
+        The pull request is fetched at most once per interval (in seconds), using its ETag
+        so unchanged pull requests come back as a cheap 304 Not Modified.
+        """
+        self.session = session
+        self.url = url
+        self.sha = sha
+        self.interval = interval
+        self.head_sha = head_sha
+        self.etag = etag
+        self.last_check = None
+
+    def out_of_date(self):
+        if self.last_check is None or time.time() - self.last_check >= self.interval:
+            self.refresh()
+            self.last_check = time.time()
+        return self.head_sha is not None and self.head_sha != self.sha
+
+    def refresh(self):
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        try:
+            response = self.session.get(self.url, headers=headers)
+        except requests.RequestException:
+            traceback.print_exc()
+            return
+
+        if response.status_code != 200:
+            return
+
+        self.etag = response.headers.get("ETag")
+        self.head_sha = response.json()["head"]["sha"]
+
+
+def body_key(body):
+    """Hash a comment body, ignoring surrounding whitespace."""
+    return hashlib.sha1(body.strip().encode("utf-8")).hexdigest()
+
+
+class ReviewCommentStore(object):
+    def __init__(self, pull_request, interval=1):
+        """
+        Local copy of a pull request's review comments, indexed for duplicate lookups.
+
+        After the first full listing, refreshes only ask GitHub for comments updated since
+        the newest one we've seen, and at most once per interval (in seconds). Those
+        listings don't include deleted comments, see refresh(full=True).
+        """
+        self.pull_request = pull_request
+        self.interval = interval
+        self.last_update = None
+        self.since = None
+        # comment id -> comment
+        self.comments = dict()
+        # comment id -> (path, original position, body hash)
+        self.keys = dict()
+        # (path, original position, body hash) -> comment
+        self.index = dict()
+        self.lock = threading.RLock()
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.comments.values()))
+
+    def refresh(self, force=False, full=False):
+        """
+        Catch up with GitHub. full replaces our copy with a full listing, dropping
+        comments that were deleted since.
+        """
+        with self.lock:
+            if full:
+                comments = list(self.pull_request.review_comments())
+                self.comments.clear()
+                self.keys.clear()
+                self.index.clear()
+                self.since = None
+                self.load(comments)
+                return
+
+            if (
+                not force
+                and self.last_update is not None
+                and time.time() - self.last_update <= self.interval
+            ):
+                return
+
+            self.load(self._fetch())
+
+    def load(self, comments):
+        """Add a full or incremental listing of comments."""
+        with self.lock:
+            for comment in comments:
+                self.add(comment)
+                updated_at = getattr(comment, "updated_at", None)
+                if updated_at and (self.since is None or updated_at > self.since):
+                    self.since = updated_at
+            self.last_update = time.time()
+
+    def _fetch(self):
+        if self.since is None:
+            return self.pull_request.review_comments()
+
+        try:
+            url = self.pull_request._build_url(
+                "comments", base_url=self.pull_request._api
+            )
+            return self.pull_request._iter(
+                -1,
+                url,
+                github3.pulls.ReviewComment,
+                params={"since": self.since.strftime("%Y-%m-%dT%H:%M:%SZ")},
+            )
+        except (AttributeError, TypeError):
+            # github3 versions without `since` support get a full relisting
+            return self.pull_request.review_comments()
+
+    def add(self, comment):
+        key = (comment.path, comment.original_position, body_key(comment.body))
+        with self.lock:
+            self.remove(comment)
+            self.comments[comment.id] = comment
+            self.keys[comment.id] = key
+            self.index[key] = comment
+
+    def remove(self, comment):
+        with self.lock:
+            previous = self.comments.pop(comment.id, None)
+            key = self.keys.pop(comment.id, None)
+            if previous and self.index.get(key) is previous:
+                del self.index[key]
+
+    def find(self, path, position, body):
+        return self.index.get((path, position, body_key(body)))
 
 
 class GitHubInterface(InterfaceBase):
@@ -28,6 +190,13 @@ class GitHubInterface(InterfaceBase):
         commit=None,
         ignore_paths=None,
         prefix=None,
+        batch_review=False,
+        freshness_interval=10,
+        http_cache=True,
+        partial_fetch=False,
+        post_concurrency=1,
+        graphql=False,
+        tokens=None,
     ):
         """
         GitHubInterface lets us post messages to GitHub.
@@ -44,49 +213,69 @@ class GitHubInterface(InterfaceBase):
         commit is the commit hash we're running against
 
         ignore_paths are paths to ignore comments from
+
+        batch_review submits new comments as a few pull request reviews instead of
+        creating them one at a time
+
+        freshness_interval is the minimum number of seconds between checks for new commits
+        on the pull request
+
+        http_cache turns repeated API reads into conditional requests, using ETags stored on
+        disk across runs
+
+        partial_fetch skips downloading file contents when fetching the PR base, if the
+        local clone is a partial clone
+
+        post_concurrency is how many comments to create, edit or delete at once
+
+        graphql loads the pull request's base and head and its existing review comments in
+        one paginated GraphQL query instead of REST listings
+
+        tokens is a list of API tokens to use instead of token. Each request is sent with
+        whichever token has the most rate limit quota left
         """
         self.github = None
         self.stopped_early = False
         self.prefix = prefix
+        self.batch_review = batch_review
         self.ignore_paths = set(ignore_paths or [])
+        self.token_pool = None
+        if tokens and len(tokens) > 1:
+            self.token_pool = tokenpool.TokenPool(tokens)
+            token = None
+        elif tokens:
+            # a single token from the envvar or tokens file doesn't need a pool
+            token = token or tokens[0]
         if not url or url == "https://github.com":
             self.github = github3.GitHub(token=token)
         else:
             self.github = github3.GitHubEnterprise(url, token=token)
+        self.post_concurrency = max(int(post_concurrency or 1), 1)
+        self.pool = None
+        self.lock = threading.Lock()
+        # one keep-alive connection per posting thread
+        adapter_kwargs = {"pool_maxsize": max(self.post_concurrency, 10)}
+        self.http_cache = None
+        if http_cache:
+            self.http_cache = httpcache.install(self.github.session, **adapter_kwargs)
+        else:
+            self.github.session.mount("https://", HTTPAdapter(**adapter_kwargs))
+            self.github.session.mount("http://", HTTPAdapter(**adapter_kwargs))
+        if self.token_pool:
+            print("Using a pool of {0} tokens.".format(len(tokens)))
+            self.github.session.auth = tokenpool.TokenPoolAuth(self.token_pool)
+        self.scheduler = ratelimit.RequestScheduler(token_pool=self.token_pool)
+        self.github.session.hooks["response"].append(self.scheduler.update)
         self.owner = owner
         self.repo = repo
 
         self.github_repo = self.github.repository(self.owner, self.repo)
-        all_commits = self.repo_commits(self.github_repo)
-        self.master_sha = all_commits[0].sha
-        print("Master SHA: {0}".format(self.master_sha))
 
         print("Branch: {0}".format(branch))
         self.pull_request_number = None
+        self.last_sha = commit or git.current_sha()
         if branch and not pr:
-            for github_repo in [self.github_repo, self.github_repo.parent]:
-                if pr:
-                    break
-
-                if not github_repo:
-                    continue
-
-                try:
-                    # github.py == 0.9.6
-                    pulls = github_repo.iter_pulls()
-                except AttributeError:
-                    pulls = github_repo.pull_requests()
-
-                for pull_request in pulls:
-                    print(
-                        "Branch: {} - Pull Request Head Ref: {}".format(
-                            branch, pull_request.head.ref
-                        )
-                    )
-                    if pull_request.head.ref == branch:
-                        pr = pull_request.number
-                        self.github_repo = github_repo
-                        break
+            self.github_repo, pr = self.find_pull_request(branch, self.last_sha)
 
         self.owner = self.github_repo.owner
         self.repo = self.github_repo.name
@@ -101,54 +290,153 @@ class GitHubInterface(InterfaceBase):
 
         print("PR ID: {0}".format(pr))
         self.pull_request_number = pr
+        # we still need the REST object to post, but the http cache makes refetches free
         self.pull_request = self.github.pull_request(self.owner, self.repo, pr)
-        self.target_sha = self.pull_request.base.sha
-        self.target_branch = self.pull_request.base.label
-        try:
-            # github.py == 0.9.6
-            try:
-                git.fetch(self.pull_request.base.to_json()["repo"]["clone_url"])
-            except subprocess.CalledProcessError:
-                git.fetch(self.pull_request.base.to_json()["repo"]["ssh_url"])
-        except AttributeError:
-            # latest github.py
+        pr_data = self.load_graphql(pr) if graphql else None
+        if pr_data:
+            self.target_sha = pr_data.base_sha
+            self.target_branch = pr_data.base_label
+            head_sha = pr_data.head_sha
+            base_repo = {"clone_url": pr_data.clone_url, "ssh_url": pr_data.ssh_url}
+        else:
+            self.target_sha = self.pull_request.base.sha
+            self.target_branch = self.pull_request.base.label
+            head_sha = self.pull_request.head.sha
             try:
-                git.fetch(self.pull_request.base.repository.as_dict()["clone_url"])
-            except subprocess.CalledProcessError:
-                git.fetch(self.pull_request.base.repository.as_dict()["ssh_url"])
+                # github.py == 0.9.6
+                base_repo = self.pull_request.base.to_json()["repo"]
+            except AttributeError:
+                # latest github.py
+                base_repo = self.pull_request.base.repository.as_dict()
+        # our diff is target..last, so the base commit itself is all we need
+        try:
+            git.fetch_commit(
+                base_repo["clone_url"], self.target_sha, blob_filter=partial_fetch
+            )
+        except subprocess.CalledProcessError:
+            git.fetch_commit(
+                base_repo["ssh_url"], self.target_sha, blob_filter=partial_fetch
+            )
 
         print("Target SHA: {0}".format(self.target_sha))
         print("Target Branch: {0}".format(self.target_branch))
-        self.commits = self.pr_commits(self.pull_request)
-        self.last_sha = commit or git.current_sha()
         print("Last SHA: {0}".format(self.last_sha))
-        self.first_sha = self.commits[0].sha
-        self.diff = git.diff(self.target_sha, self.last_sha)
-        self.patch = unidiff.PatchSet(self.diff.split("\n"))
-        self.review_comments = list(self.pull_request.review_comments())
-        self.last_update = time.time()
+        self.freshness = FreshnessChecker(
+            self.github.session,
+            self.pull_request._api,
+            self.last_sha,
+            freshness_interval,
+            head_sha=head_sha,
+            etag=getattr(self.pull_request, "etag", None),
+        )
+        self.diff_index = diff.DiffIndex(git.diff_lines(self.target_sha, self.last_sha))
+        # review comments are only listed once we need them for deduping
+        self.review_comments = ReviewCommentStore(self.pull_request)
+        if pr_data and pr_data.review_comments is not None:
+            self.review_comments.load(pr_data.review_comments)
         self.messages_in_files = dict()
+        self.formatted_messages = dict()
 
     def is_valid(self):
         return self.pull_request_number is not None
 
-    @staticmethod
-    def pr_commits(pull_request):
-        # github3 has naming/compatibility issues
+    def load_graphql(self, pr):
+        """Load pull request data with GraphQL, or return None to fall back to REST."""
         try:
-            return [c for c in pull_request.commits()]
+            return github_graphql.load_pull_request(
+                self.github.session, str(self.owner), self.repo, pr
+            )
 
-        except (AttributeError, TypeError):
-            return [c for c in pull_request.iter_commits()]
+        except (
+            github3.GitHubError,
+            github_graphql.GraphQLError,
+            requests.RequestException,
+            KeyError,
+            TypeError,
+            ValueError,
+        ):
+            traceback.print_exc()
+            print("Loading the pull request with GraphQL failed, using REST instead.")
+            return None
+
+    def find_pull_request(self, branch, sha):
+        """
+        Find the open pull request for a branch, in this repo or its parent.
+
+        Lookups go through the pulls endpoint's head filter. Results are cached on disk per
+        branch and reused while the branch still points at the same commit. Paging through
+        open pull requests is only a last resort.
+        """
+        candidates = [
+            github_repo
+            for github_repo in [self.github_repo, self.github_repo.parent]
+            if github_repo
+        ]
+        cache = httpcache.DiskCache(
+            system.cache_dir("pulls"), max_entries=httpcache.MAX_ENTRIES
+        )
+        key = hashlib.sha1(
+            "{}:{}".format(self.github_repo._api, branch).encode("utf-8")
+        ).hexdigest()
+        cached = cache.get(key)
+        if cached and cached.get("head_sha") == sha:
+            for github_repo in candidates:
+                if github_repo.full_name == cached.get("repo"):
+                    print("Using cached pull request for branch {}".format(branch))
+                    return github_repo, cached["number"]
+
+        head = "{}:{}".format(self.github_repo.owner.login, branch)
+        found = self._pull_request_by_head(candidates, branch, head)
+        if not found:
+            print("No pull request found for {}, scanning open pulls".format(head))
+            found = self._pull_request_by_scan(candidates, branch)
+        if not found:
+            return self.github_repo, None
+
+        github_repo, pull_request = found
+        cache.set(
+            key,
+            {
+                "repo": github_repo.full_name,
+                "number": pull_request.number,
+                "head_sha": pull_request.head.sha,
+            },
+        )
+        return github_repo, pull_request.number
 
     @staticmethod
-    def repo_commits(repo):
-        # github3 has naming/compatibility issues
-        try:
-            return [c for c in repo.commits()]
+    def _pull_request_by_head(candidates, branch, head):
+        for github_repo in candidates:
+            try:
+                # github.py == 0.9.6
+                pulls = github_repo.iter_pulls(state="open", head=head, number=1)
+            except AttributeError:
+                pulls = github_repo.pull_requests(state="open", head=head, number=1)
+            for pull_request in pulls:
+                if pull_request.head.ref == branch:
+                    return github_repo, pull_request
 
-        except (AttributeError, TypeError):
-            return [c for c in repo.iter_commits()]
+        return None
+
+    @staticmethod
+    def _pull_request_by_scan(candidates, branch):
+        for github_repo in candidates:
+            try:
+                # github.py == 0.9.6
+                pulls = github_repo.iter_pulls(number=MAX_PULL_REQUEST_SCAN)
+            except AttributeError:
+                pulls = github_repo.pull_requests(number=MAX_PULL_REQUEST_SCAN)
+
+            for pull_request in pulls:
+                print(
+                    "Branch: {} - Pull Request Head Ref: {}".format(
+                        branch, pull_request.head.ref
+                    )
+                )
+                if pull_request.head.ref == branch:
+                    return github_repo, pull_request
+
+        return None
 
     def start_review(self):
         """Mark our review as started."""
@@ -159,8 +447,17 @@ class GitHubInterface(InterfaceBase):
             sha=self.last_sha,
         )
 
-    def finish_review(self, success=True, error=False):
-        """Mark our review as finished."""
+    def finish_review(self, success=True, error=False, truncated=False):
+        """
+        Mark our review as finished.
+
+        truncated means linting stopped early because max_comments was reached.
+        """
+        if self.pool:
+            self.pool.close()
+            self.pool = None
+        if self.http_cache:
+            self.http_cache.report()
         if error:
             self.github_repo.create_status(
                 state="error",
@@ -175,6 +472,14 @@ class GitHubInterface(InterfaceBase):
                 context="inline-plz",
                 sha=self.last_sha,
             )
+        elif truncated:
+            self.github_repo.create_status(
+                state="failure",
+                description="Static analysis stopped early! Found errors in your PR, "
+                "results were truncated.",
+                context="inline-plz",
+                sha=self.last_sha,
+            )
         else:
             self.github_repo.create_status(
                 state="failure",
@@ -183,106 +488,366 @@ class GitHubInterface(InterfaceBase):
                 sha=self.last_sha,
             )
 
+    @staticmethod
+    def pr_commits(pull_request):
+        """
+        List all of the pull request's commits, oldest first.
+
+        GitHub can't list them newest first or from a given commit on, so finding the
+        newest ones means listing them all (at most 250 per pull request).
+        """
+        # github3 has naming/compatibility issues
+        try:
+            return [c for c in pull_request.commits()]
+
+        except (AttributeError, TypeError):
+            return [c for c in pull_request.iter_commits()]
+
+    def reviewed_shas(self):
+        """
+        Yield the pull request's commits that we finished reviewing, newest first.
+
+        Our status on a commit marks it: a review that errored or stopped early doesn't
+        count. Only the newest MAX_REVIEWED_LOOKBACK commits are checked.
+        """
+        commits = [commit.sha for commit in self.pr_commits(self.pull_request)]
+        for sha in reversed(commits[-MAX_REVIEWED_LOOKBACK:]):
+            try:
+                # github.py == 0.9.6
+                statuses = self.github_repo.iter_statuses(sha)
+            except AttributeError:
+                statuses = self.github_repo.statuses(sha)
+            for status in statuses:
+                # newest first, so the first of ours is the current one
+                if status.context == "inline-plz":
+                    if (status.description or "").startswith(COMPLETE_DESCRIPTION):
+                        yield sha
+                    break
+
     def out_of_date(self):
         """Check if our local latest sha matches the remote latest sha"""
-        pull_request = self.github.pull_request(
-            self.owner, self.repo, self.pull_request_number
-        )
-        latest_remote_sha = self.pr_commits(pull_request)[-1].sha
-        return self.last_sha != latest_remote_sha
+        return self.freshness.out_of_date()
 
     def post_messages(self, messages, max_comments):
         if not self.github:
             print("Github connection is invalid.")
             return
 
-        valid_errors = 0
-        messages_posted = 0
-        paths = dict()
+        self.begin_posting(max_comments)
+        self.queue_messages(messages)
+        return self.end_posting()
+
+    def begin_posting(self, max_comments):
+        """
+        Start a posting session that messages can be queued into as linters finish.
+
+        The comment budget and deduping apply across every queue_messages call until
+        end_posting.
+        """
+        self.valid_errors = 0
+        self.messages_posted = 0
+        self.pending_comments = []
+        self.pending_index = dict()
+        # (path, position) -> formatted body of every comment posted in this session
+        self.posted_bodies = dict()
+        # we've always posted one comment past max_comments before stopping
+        self.budget = max_comments + 1 if max_comments else None
+        self.posting_done = False
+        if self.out_of_date():
+            print("This run is out of date because the PR has been updated.")
+            self.posting_done = True
+
+    def queue_messages(self, messages):
+        """
+        Post messages now. A message at a position we've already posted to in this session
+        (a later linter adding to the same line) edits that comment without using up budget.
+        """
+        if self.posting_done:
+            return
 
         # randomize message order to more evenly distribute messages across different files
         messages = list(messages)
         random.shuffle(messages)
-        if self.out_of_date():
-            print("This run is out of date because the PR has been updated.")
-            messages = []
         print("Considering {} messages for posting.".format(len(messages)))
-        for msg in messages:
+        queue = collections.deque((msg, 0) for msg in messages)
+        while queue:
             # rate limit
             if system.should_stop() or self.out_of_date():
                 print("Stopping early.")
                 self.stopped_early = True
+                self.posting_done = True
                 break
 
-            if not msg.comments:
-                continue
+            batch = []
+            new_comments = []
+            while queue and len(batch) < self.post_concurrency:
+                msg, deferrals = queue.popleft()
+                msg_position = self.postable_position(msg)
+                if not msg_position:
+                    continue
 
-            msg_position = self.position(msg)
-            if not msg_position:
-                continue
+                key = (msg.path, msg_position)
+                is_new = key not in self.posted_bodies and key not in self.pending_index
+                if (
+                    is_new
+                    and self.budget is not None
+                    and self.messages_posted + sum(new_comments) >= self.budget
+                ):
+                    continue
 
-            if msg.path.split("/")[0] in self.ignore_paths:
-                continue
+                batch.append((msg, msg_position, deferrals))
+                new_comments.append(is_new)
 
-            paths.setdefault(msg.path, 0)
+            for (msg, _, deferrals), is_new, result in zip(
+                batch, new_comments, self.pool_map(self.post_message, batch)
+            ):
+                if result == POSTED:
+                    if is_new:
+                        self.valid_errors += 1
+                        self.messages_posted += 1
+                elif result == DEFERRED:
+                    if deferrals < MAX_DEFERRALS:
+                        queue.append((msg, deferrals + 1))
+                    else:
+                        print("Giving up on rate limited comment: {0}".format(msg))
+
+    def end_posting(self):
+        """Flush pending reviews and return how many messages were posted."""
+        if self.pending_comments and self.stopped_early:
+            print(
+                "Dropping {} pending comments, posting stopped early.".format(
+                    len(self.pending_comments)
+                )
+            )
+            self.valid_errors -= len(self.pending_comments)
+            self.messages_posted -= len(self.pending_comments)
+            self.pending_comments = []
+            self.pending_index = dict()
+        elif self.pending_comments:
+            rejected = self.submit_review(self.pending_comments)
+            self.valid_errors -= rejected
+            self.messages_posted -= rejected
+
+        print("\n{} messages posted to Github.".format(self.messages_posted))
+        return self.valid_errors
+
+    def pool_map(self, func, items):
+        if self.post_concurrency <= 1 or len(items) <= 1:
+            return [func(item) for item in items]
+
+        if not self.pool:
+            self.pool = Pool(processes=self.post_concurrency)
+        return self.pool.map(func, items)
+
+    def postable_position(self, msg):
+        """Return the diff position to comment at, or None if we shouldn't post msg."""
+        if not msg.comments:
+            return None
+
+        msg_position = self.position(msg)
+        if not msg_position:
+            return None
+
+        if msg.path.split("/")[0] in self.ignore_paths:
+            return None
+
+        return msg_position
+
+    def post_message(self, item):
+        """Edit, create or queue up one comment. Safe to run from worker threads."""
+        msg, msg_position, deferrals = item
+        try:
+            duplicate = self.is_duplicate(msg, msg_position) or self.posted_comment(
+                msg, msg_position
+            )
+            if duplicate and self.update_comment(duplicate, msg, msg_position):
+                return POSTED
+
+            if self.batch_review:
+                with self.lock:
+                    key = (msg.path, msg_position)
+                    if key in self.pending_index:
+                        # a later linter added to this line, review the combined message
+                        self.pending_comments[self.pending_index[key]] = (
+                            msg,
+                            msg_position,
+                        )
+                    else:
+                        self.pending_index[key] = len(self.pending_comments)
+                        self.pending_comments.append((msg, msg_position))
+                return POSTED
 
-            valid_errors += 1
-            duplicate = self.is_duplicate(msg, msg_position)
-            if duplicate:
-                try:
-                    duplicate.edit(self.format_message(msg))
-                    self.messages_in_files.setdefault(msg.path, []).append(
-                        (msg, msg_position)
-                    )
-                    print("Comment edited successfully: {0}".format(msg))
-                    paths[msg.path] += 1
-                    messages_posted += 1
-                    time.sleep(.1)
-                    continue
+            if self.create_comment(msg, msg_position):
+                print("Comment posted successfully: {0}".format(msg))
+                return POSTED
 
-                except github3.GitHubError:
-                    pass
+            # workaround for our diff not entirely matching up with github's diff
+            # we can end up with a mismatched diff if the branch is old
+            return REJECTED
 
+        except github3.GitHubError:
+            # only rate limit errors make it out of the helpers above
+            self.scheduler.backoff(deferrals)
+            return DEFERRED
+
+    def update_comment(self, duplicate, msg, msg_position):
+        """
+        Bring an existing comment up to date. Returns False if GitHub rejected the edit.
+
+        Rate limit errors are raised so the caller can retry later.
+        """
+        body = self.format_message(msg)
+        if duplicate.body != body:
+            self.scheduler.wait()
+            try:
+                duplicate.edit(body)
+            except github3.GitHubError as error:
+                if self.scheduler.is_rate_limited(error):
+                    raise
+                return False
+
+            # reindex under the new body so later edits can find it
+            self.review_comments.add(duplicate)
+            print("Comment edited successfully: {0}".format(msg))
+        else:
+            print("Comment already posted: {0}".format(msg))
+        self.posted_bodies[(msg.path, msg_position)] = body
+        self.messages_in_files.setdefault(msg.path, []).append((msg, msg_position))
+        return True
+
+    def create_comment(self, msg, msg_position):
+        """
+        Post a single review comment. Returns False if GitHub rejected it.
+
+        Rate limit errors are raised so the caller can retry later.
+        """
+        body = self.format_message(msg)
+        self.scheduler.wait()
+        try:
+            comment = self.pull_request.create_review_comment(
+                body, self.last_sha, msg.path, msg_position
+            )
+        except github3.GitHubError as error:
+            if self.scheduler.is_rate_limited(error):
+                raise
+            return False
+
+        if comment:
+            self.review_comments.add(comment)
+        self.posted_bodies[(msg.path, msg_position)] = body
+        self.messages_in_files.setdefault(msg.path, []).append((msg, msg_position))
+        return True
+
+    def review_batches(self, pending_comments):
+        """Split pending comments into chunks that fit in a single review request."""
+        batch = []
+        batch_size = 0
+        for msg, msg_position in pending_comments:
+            comment = {
+                "path": msg.path,
+                "position": int(msg_position),
+                "body": self.format_message(msg),
+            }
+            comment_size = len(json.dumps(comment))
+            if batch and batch_size + comment_size > REVIEW_BATCH_BYTES:
+                yield batch
+                batch = []
+                batch_size = 0
+            batch.append((msg, msg_position, comment))
+            batch_size += comment_size
+        if batch:
+            yield batch
+
+    def create_review(self, batch):
+        self.scheduler.wait()
+        return self.pull_request.create_review(
+            "{0}: {1} lint messages".format(self.prefix, len(batch)),
+            commit_id=self.last_sha,
+            event="COMMENT",
+            comments=[comment for _, _, comment in batch],
+        )
+
+    def submit_review(self, pending_comments):
+        """
+        Post pending comments as pull request reviews.
+
+        If GitHub rejects a review, its comments are retried one at a time so a single bad
+        position doesn't sink the whole batch. Returns the number of rejected comments,
+        counting comments left unposted because the run stopped early.
+        """
+        rejected = 0
+        remaining = len(pending_comments)
+        for batch in self.review_batches(pending_comments):
+            if system.should_stop() or self.out_of_date():
+                print("Stopping early, {} comments not posted.".format(remaining))
+                self.stopped_early = True
+                return rejected + remaining
+            remaining -= len(batch)
             try:
-                self.pull_request.create_review_comment(
-                    self.format_message(msg), self.last_sha, msg.path, msg_position
+                self.with_retries(self.create_review, batch)
+            except github3.GitHubError:
+                print(
+                    "Review rejected, posting {} comments individually.".format(
+                        len(batch)
+                    )
                 )
+                for msg, msg_position, _ in batch:
+                    try:
+                        posted = self.with_retries(
+                            self.create_comment, msg, msg_position
+                        )
+                    except github3.GitHubError:
+                        posted = False
+                    if posted:
+                        print("Comment posted successfully: {0}".format(msg))
+                    else:
+                        rejected += 1
+                continue
+
+            for msg, msg_position, _ in batch:
                 self.messages_in_files.setdefault(msg.path, []).append(
                     (msg, msg_position)
                 )
-            except github3.GitHubError:
-                # workaround for our diff not entirely matching up with github's diff
-                # we can end up with a mismatched diff if the branch is old
-                valid_errors -= 1
-                continue
+            print("Review posted successfully with {} comments.".format(len(batch)))
+        return rejected
 
-            print("Comment posted successfully: {0}".format(msg))
-            paths[msg.path] += 1
-            messages_posted += 1
-            time.sleep(.1)
-            if max_comments and messages_posted > max_comments:
-                break
+    def with_retries(self, func, *args, **kwargs):
+        """Call func, backing off and trying again while GitHub rate limits us."""
+        for attempt in range(MAX_DEFERRALS + 1):
+            try:
+                return func(*args, **kwargs)
 
-        print("\n{} messages posted to Github.".format(messages_posted))
-        return valid_errors
+            except github3.GitHubError as error:
+                if attempt == MAX_DEFERRALS or not self.scheduler.is_rate_limited(
+                    error
+                ):
+                    raise
+
+                self.scheduler.backoff(attempt)
 
     def is_duplicate(self, message, position):
         # update our list of review comments about once a second
         # to reduce dupes without hitting the API too hard
-        if time.time() - self.last_update > 1:
-            self.review_comments = list(self.pull_request.review_comments())
-            self.last_update = time.time()
-        for comment in self.review_comments:
-            if (
-                comment.original_position == position
-                and comment.path == message.path
-                and comment.body.strip() == self.format_message(message).strip()
-            ):
-                return comment
+        self.review_comments.refresh()
+        return self.review_comments.find(
+            message.path, position, self.format_message(message)
+        )
 
-        return None
+    def posted_comment(self, message, position):
+        """Find the comment we posted at position earlier in this session, if any."""
+        body = self.posted_bodies.get((message.path, position))
+        if not body:
+            return None
+
+        return self.review_comments.find(message.path, position, body)
 
     def format_message(self, message):
+        key = (message.path, message.line_number, frozenset(message.comments))
+        if key not in self.formatted_messages:
+            self.formatted_messages[key] = self._format_message(message)
+        return self.formatted_messages[key]
+
+    def _format_message(self, message):
         if not message.comments:
             return ""
 
@@ -299,41 +864,47 @@ class GitHubInterface(InterfaceBase):
         if self.stopped_early:
             return
 
-        for comment in self.pull_request.review_comments():
-            try:
-                should_delete = True
-                if not comment.body.startswith(self.prefix):
-                    continue
+        posted = {
+            (path, msg_position, body_key(self.format_message(msg)))
+            for path, messages in self.messages_in_files.items()
+            for msg, msg_position in messages
+        }
+        # someone may have deleted comments during the run, which `since` listings miss
+        self.review_comments.refresh(full=True)
+        outdated = [
+            comment
+            for comment in self.review_comments
+            if comment.body.startswith(self.prefix)
+            and (comment.path, comment.position, body_key(comment.body)) not in posted
+        ]
+        # deletions don't depend on each other, so they can all go out at once
+        self.pool_map(self.delete_comment, outdated)
+
+    def delete_comment(self, comment):
+        try:
+            deleted = self.with_retries(self._delete_comment, comment)
+        except github3.GitHubError as error:
+            if error.code != 404:
+                traceback.print_exc()
+                return
+            deleted = False
+        except Exception:
+            traceback.print_exc()
+            return
 
-                for msg, msg_position in self.messages_in_files.get(comment.path, []):
-                    if (
-                        self.format_message(msg).strip() == comment.body.strip()
-                        and msg_position == comment.position
-                    ):
-                        should_delete = False
-                if not should_delete:
-                    continue
+        self.review_comments.remove(comment)
+        if deleted:
+            print("Deleted comment: {}".format(comment.body))
+        else:
+            # github3 returns False on a 404
+            print("Comment was already deleted: {}".format(comment.body))
 
-                comment.delete()
-                print("Deleted comment: {}".format(comment.body))
-            except Exception:
-                traceback.print_exc()
+    def _delete_comment(self, comment):
+        self.scheduler.wait()
+        return comment.delete()
 
     def position(self, message):
         """Calculate position within the PR, which is not the line number"""
         if not message.line_number:
             message.line_number = 1
-        for patched_file in self.patch:
-            target = patched_file.target_file.lstrip("b/")
-            if target == message.path:
-                offset = 1
-                for hunk in patched_file:
-                    for position, hunk_line in enumerate(hunk):
-                        if hunk_line.target_line_no == message.line_number:
-                            if not hunk_line.is_added:
-                                # if the line isn't an added line, we don't want to comment on it
-                                return
-
-                            return position + offset
-
-                    offset += len(hunk) + 1
+        return self.diff_index.position(message.path, message.line_number)
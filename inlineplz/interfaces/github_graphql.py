@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+"""
+Load what we need to know about a pull request from GitHub's GraphQL API.
+
+The REST API needs a request for the pull request plus a page per 30 review comments,
+and we relist those comments while posting. One paginated GraphQL query gets the base
+and head commits along with every review thread.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import github3
+from github3.models import GitHubCore
+
+PULL_REQUEST_QUERY = """
+query($owner: String!, $repo: String!, $number: Int!, $threads: String) {
+  repository(owner: $owner, name: $repo) {
+    pullRequest(number: $number) {
+      headRefOid
+      baseRefOid
+      baseRefName
+      baseRepository {
+        url
+        sshUrl
+        owner {
+          login
+        }
+      }
+      reviewThreads(first: 100, after: $threads) {
+        pageInfo {
+          hasNextPage
+          endCursor
+        }
+        nodes {
+          comments(first: 100) {
+            pageInfo {
+              hasNextPage
+            }
+            nodes {
+              databaseId
+              path
+              position
+              originalPosition
+              body
+              updatedAt
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+
+class GraphQLError(Exception):
+    pass
+
+
+def graphql_url(base_url):
+    """GitHub serves GraphQL at /graphql, and GitHub Enterprise at /api/graphql."""
+    base_url = base_url.rstrip("/")
+    if base_url.endswith("/api/v3"):
+        return base_url[: -len("/v3")] + "/graphql"
+
+    return base_url + "/graphql"
+
+
+class ReviewThreadComment(object):
+    def __init__(self, session, repo_api, node):
+        """A review comment from GraphQL that can be edited and deleted like github3's."""
+        self.session = session
+        self.id = node["databaseId"]
+        self.path = node["path"]
+        self.position = node["position"]
+        self.original_position = node["originalPosition"]
+        self.body = node["body"]
+        self.updated_at = GitHubCore._strptime(node["updatedAt"])
+        self._api = "{0}/pulls/comments/{1}".format(repo_api, self.id)
+
+    def edit(self, body):
+        response = self.session.patch(self._api, json={"body": body})
+        if response.status_code != 200:
+            raise github3.exceptions.error_for(response)
+
+        self.body = body
+        return True
+
+    def delete(self):
+        response = self.session.delete(self._api)
+        if response.status_code != 204:
+            raise github3.exceptions.error_for(response)
+
+        return True
+
+
+class PullRequestData(object):
+    def __init__(self):
+        self.head_sha = None
+        self.base_sha = None
+        # owner:branch, like the REST API's base.label
+        self.base_label = None
+        self.clone_url = None
+        self.ssh_url = None
+        # None if a thread has more comments than one query returns, so REST lists them
+        self.review_comments = []
+
+
+def load_pull_request(session, owner, repo, number):
+    """Fetch pull request metadata and all review comments, a page of threads at a time."""
+    url = graphql_url(session.base_url)
+    repo_api = "{0}/repos/{1}/{2}".format(session.base_url.rstrip("/"), owner, repo)
+    data = PullRequestData()
+    variables = {"owner": owner, "repo": repo, "number": int(number), "threads": None}
+    while True:
+        pull_request = query(session, url, variables)["repository"]["pullRequest"]
+        if pull_request is None:
+            raise GraphQLError("Pull request {0} not found".format(number))
+
+        data.head_sha = pull_request["headRefOid"]
+        data.base_sha = pull_request["baseRefOid"]
+        base_repository = pull_request["baseRepository"]
+        data.base_label = "{0}:{1}".format(
+            base_repository["owner"]["login"], pull_request["baseRefName"]
+        )
+        data.clone_url = base_repository["url"] + ".git"
+        data.ssh_url = base_repository["sshUrl"]
+        threads = pull_request["reviewThreads"]
+        for thread in threads["nodes"]:
+            if thread["comments"]["pageInfo"]["hasNextPage"]:
+                # rare enough that paginating each thread isn't worth it
+                data.review_comments = None
+                return data
+
+            for node in thread["comments"]["nodes"]:
+                data.review_comments.append(
+                    ReviewThreadComment(session, repo_api, node)
+                )
+        if not threads["pageInfo"]["hasNextPage"]:
+            return data
+
+        variables["threads"] = threads["pageInfo"]["endCursor"]
+
+
+def query(session, url, variables):
+    response = session.post(
+        url, json={"query": PULL_REQUEST_QUERY, "variables": variables}
+    )
+    if response.status_code != 200:
+        raise github3.exceptions.error_for(response)
+
+    result = response.json()
+    if result.get("errors"):
+        raise GraphQLError(
+            "; ".join(error.get("message", "") for error in result["errors"])
+        )
+
+    return result["data"]
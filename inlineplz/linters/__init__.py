@@ -7,6 +7,7 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import fnmatch
+import hashlib
 from multiprocessing.pool import ThreadPool as Pool
 import os.path
 import shutil
@@ -28,12 +29,22 @@ try:
 except ImportError:
     from scandir import scandir, walk  # noqa
 
+from inlineplz import __version__
 from inlineplz import parsers
 from inlineplz import message
-from inlineplz.util import system
+from inlineplz.util import git, lintcache, system
 
 HERE = os.path.dirname(__file__)
 
+# files per batch when a per-file linter might stop early
+PER_FILE_BATCH_SIZE = 50
+# seconds a per-file linter gets for each file
+PER_FILE_TIMEOUT = 5
+# how long we assume a linter takes when sharding without historical durations
+DEFAULT_LINTER_SECONDS = 60
+# native linter caches for other configs are deleted once unused for this many seconds
+NATIVE_CACHE_MAX_AGE = 7 * 24 * 60 * 60
+
 
 if sys.platform == "win32":
     JAVA_SEP = ";"
@@ -77,6 +88,18 @@ PATTERNS = {
     "yaml": ["*.yaml", "*.yml"],
 }
 
+# config files linters pick up on their own, anywhere in the tree, on top of dotfiles
+IMPLICIT_CONFIGS = [
+    "*setup.cfg",
+    "*tox.ini",
+    "*pyproject.toml",
+    "*.flake8",
+    "*pylintrc",
+    "*.eslintrc*",
+    "*.editorconfig",
+    "*package.json",
+]
+
 # these commands will be autorun to try to install dependencies.
 TRUSTED_INSTALL = [
     ["bundle", "install"],
@@ -266,6 +289,7 @@ LINTERS = {
             "--ignore-path",
             "{config_dir}/.eslintignore",
         ],
+        "cache": {"args": ["--cache", "--cache-location", "{cache_dir}/"]},
         "dotfiles": [
             ".eslintrc.yml",
             ".eslintrc.yaml",
@@ -336,6 +360,7 @@ LINTERS = {
             "--config={config_dir}/.gometalinter.json",
             "./...",
         ],
+        "cache": {"env": {"GOCACHE": "{cache_dir}"}},
         "dotfiles": [".gometalinter.json"],
         "parser": parsers.GometalinterParser,
         "language": "go",
@@ -376,6 +401,7 @@ LINTERS = {
             "--config={config_dir}/.gometalinter.json",
             "./...",
         ],
+        "cache": {"env": {"GOCACHE": "{cache_dir}"}},
         "dotfiles": [".gometalinter.json"],
         "parser": parsers.GometalinterParser,
         "language": "go",
@@ -477,6 +503,7 @@ LINTERS = {
         "help": ["megacheck", "--help"],
         "run": ["megacheck", "-f", "json", "./..."],
         "rundefault": ["megacheck", "-f", "json", "./..."],
+        "cache": {"env": {"GOCACHE": "{cache_dir}"}},
         "dotfiles": [],
         "parser": parsers.MegacheckParser,
         "language": "go",
@@ -509,6 +536,7 @@ LINTERS = {
             "-f",
             "emacs",
         ],
+        "cache": {"args": ["-cache", "{cache_dir}/pmd.cache"]},
         "dotfiles": [],
         "parser": parsers.PMDParser,
         "language": "java",
@@ -549,6 +577,7 @@ LINTERS = {
             "-P",
             "{config_dir}/.prospector.yaml",
         ],
+        "cache": {"env": {"PYLINTHOME": "{cache_dir}"}},
         "dotfiles": [".prospector.yaml"],
         "parser": parsers.ProspectorParser,
         "language": "python",
@@ -662,7 +691,14 @@ LINTERS = {
 }
 
 
-def run_command(command, log_on_fail=False, log_all=False, timeout=120):
+def run_command(
+    command,
+    log_on_fail=False,
+    log_all=False,
+    timeout=120,
+    raise_on_timeout=False,
+    env=None,
+):
     print('Running: "{}"'.format(" ".join(command)))
     shell = False
     if os.name == "nt":
@@ -673,19 +709,24 @@ def run_command(command, log_on_fail=False, log_all=False, timeout=120):
         "stdout": subprocess.PIPE,
         "stderr": subprocess.PIPE,
         "shell": shell,
-        "env": os.environ,
+        "env": env or os.environ,
         "universal_newlines": True,
-        "timeout": timeout,
     }
     if sys.version_info[0] >= 3 and sys.version_info[1] >= 6:
         popen_kwargs["encoding"] = "utf-8"
-    try:
-        proc = subprocess.run(**popen_kwargs)
-    except subprocess.TimeoutExpired:
-        print("Timeout: {}".format(command))
-        return 0, ""
+    # tracked so a run that's been superseded can kill its linters right away
+    with system.track_process(subprocess.Popen(**popen_kwargs)) as proc:
+        try:
+            stdout, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            print("Timeout: {}".format(command))
+            if raise_on_timeout:
+                raise
+
+            return 0, ""
 
-    stdout, stderr = proc.stdout, proc.stderr
     output = "{}\n{}".format(stdout, stderr).strip()
     if output and ((log_on_fail and proc.returncode) or log_all):
         print(output)
@@ -725,26 +766,131 @@ def should_ignore_path(path, ignore_paths):
     return False
 
 
-def run_per_file(config, ignore_paths=None, path=None, config_dir=None):
+def run_per_file(
+    config, ignore_paths=None, path=None, config_dir=None, files=None, failed=None
+):
+    output = []
+    for batch in run_per_file_batches(
+        config, ignore_paths, path, config_dir, files=files, failed=failed
+    ):
+        output.extend(batch)
+    return output
+
+
+def per_file_targets(config, ignore_paths=None, path=None):
+    """List the files a per-file linter runs on."""
     ignore_paths = ignore_paths or []
     path = path or os.getcwd()
-    cmd = run_config(config, config_dir)
-    run_cmds = []
+    targets = []
     patterns = PATTERNS.get(config.get("language"))
-    concurrency = config.get("concurrency")
     paths = all_filenames_in_dir(path=path, ignore_paths=ignore_paths)
     for pattern in patterns:
         for filepath in fnmatch.filter(paths, pattern):
             if "text" in identify.tags_from_path(filepath):
-                run_cmds.append(cmd + [filepath])
+                targets.append(filepath)
+    return targets
+
+
+def run_per_file_batches(
+    config,
+    ignore_paths=None,
+    path=None,
+    config_dir=None,
+    batch_size=None,
+    stop_when=None,
+    files=None,
+    failed=None,
+):
+    """
+    Run a per-file linter batch_size files at a time, yielding each batch's output.
+
+    Remaining files are skipped once stop_when returns True. files limits the run to
+    those of the linter's files, as picked by shard_plan. If failed is a list, files
+    whose run timed out are added to it.
+    """
+    cmd = run_config(config, config_dir)
+    if files is None:
+        files = per_file_targets(config, ignore_paths, path)
+    run_cmds = [cmd + [filepath] for filepath in files]
+    concurrency = config.get("concurrency")
     pool = Pool(processes=concurrency)
 
     def result(run_cmd):
-        _, out = run_command(run_cmd, timeout=5)
+        try:
+            _, out = run_command(
+                run_cmd, timeout=PER_FILE_TIMEOUT, raise_on_timeout=True
+            )
+        except subprocess.TimeoutExpired:
+            # no output looks like a clean file
+            if failed is not None:
+                failed.append(run_cmd[-1])
+            out = ""
         return run_cmd[-1], out.strip()
 
-    output = pool.map(result, run_cmds)
-    return output
+    batch_size = batch_size or len(run_cmds) or 1
+    try:
+        for index in range(0, len(run_cmds), batch_size):
+            if index and stop_when and stop_when():
+                print("Skipping remaining files, enough messages were found.")
+                return
+
+            yield pool.map(result, run_cmds[index : index + batch_size])
+    finally:
+        pool.close()
+
+
+def content_hash(path):
+    sha = hashlib.sha1()
+    try:
+        with open(path, "rb") as content:
+            for chunk in iter(lambda: content.read(65536), b""):
+                sha.update(chunk)
+    except (IOError, OSError):
+        pass
+    return sha.hexdigest()
+
+
+def shard_plan(
+    linters, shard_index, shard_count, ignore_paths=None, path=None, durations=None
+):
+    """
+    Decide what shard shard_index (counting from 1) of shard_count runs.
+
+    Whole-repo linters are assigned whole, per-file linters file by file. Work is weighted
+    by durations (linter -> seconds from an earlier run) and handed out largest first to
+    the least loaded shard, ordered by file content hash so every node comes up with the
+    same plan no matter where the repo is checked out.
+
+    Returns a dict of linter -> None to run the whole linter, or the files to run it on.
+    """
+    durations = durations or {}
+    units = []
+    for linter in sorted(linters):
+        config = LINTERS.get(linter)
+        seconds = float(durations.get(linter) or DEFAULT_LINTER_SECONDS)
+        if config.get("run_per_file"):
+            files = per_file_targets(config, ignore_paths, path)
+            for filepath in files:
+                key = (content_hash(filepath), os.path.relpath(filepath, path))
+                units.append((seconds / len(files), key, linter, filepath))
+        else:
+            units.append((seconds, (linter, ""), linter, None))
+
+    loads = [0.0] * shard_count
+    plan = {}
+    for weight, _, linter, filepath in sorted(
+        units, key=lambda unit: (-unit[0], unit[1], unit[2])
+    ):
+        shard = min(range(shard_count), key=lambda index: (loads[index], index))
+        loads[shard] += weight
+        if shard != shard_index - 1:
+            continue
+
+        if filepath is None:
+            plan[linter] = None
+        else:
+            plan.setdefault(linter, []).append(filepath)
+    return plan
 
 
 def linters_to_run(
@@ -893,37 +1039,151 @@ def lint(
     enabled_linters=None,
     disabled_linters=None,
     trusted=False,
+    on_messages=None,
+    stop_when=None,
+    stats=None,
+    shard=None,
+    durations=None,
+    memo=None,
+    native_caches=True,
+    changed_files=None,
+    failures=None,
 ):
+    """
+    Run linters and return their messages.
+
+    If on_messages is given, it's called after each linter with the messages that linter
+    added to or updated, so they can be posted before the remaining linters finish.
+
+    If stop_when is given, it's checked before each linter and each batch of files of a
+    per-file linter, and linting ends early once it returns True.
+
+    If stats is a dict, it's filled with each linter's version, run time and message count.
+
+    shard is an (index, count) tuple to only run this node's part of the work, see
+    shard_plan. durations are linter run times from an earlier run, for balancing shards.
+
+    memo is a LintCache. Whole-repo linters whose inputs match an earlier run reuse that
+    run's messages instead of running again, see memo_key.
+
+    native_caches enables the incremental caches of linters that have their own, in
+    persistent directories, see native_cache.
+
+    changed_files limits per-file linters to those paths, relative to the repo root.
+
+    If failures is a list, the linters that failed, timed out or whose output couldn't
+    be parsed are added to it, since their missing messages look like a clean run.
+    """
     messages = message.Messages()
+    # before anything installs linters into the checkout, see memo_key
+    clean = tree_is_clean() if memo is not None else None
     cleanup()
     performance_hacks()
     if trusted and (install or autorun):
         install_trusted()
-    for linter in linters_to_run(
-        autorun, ignore_paths, enabled_linters, disabled_linters
-    ):
+    selected = linters_to_run(autorun, ignore_paths, enabled_linters, disabled_linters)
+    plan = None
+    if shard:
+        # per-file linters get config_dir as their path below, so plan with the same
+        plan = shard_plan(
+            selected, shard[0], shard[1], ignore_paths, config_dir, durations
+        )
+        print("Shard {0}/{1} runs: {2}".format(shard[0], shard[1], sorted(plan)))
+    for linter in selected:
+        if plan is not None and linter not in plan:
+            continue
+
         if system.should_stop():
             return messages.get_messages()
 
+        if stop_when and stop_when():
+            print("Skipping remaining linters, enough messages were found.")
+            break
+
         print("=" * 80)
         print("Running linter: {0}".format(linter))
         sys.stdout.flush()
         start = time.time()
+        linter_start = start
+        message_count = len(messages.messages)
         output = ""
         config = LINTERS.get(linter)
+        files = plan.get(linter) if plan else None
+        if changed_files is not None and config.get("run_per_file"):
+            if files is None:
+                files = per_file_targets(config, ignore_paths, config_dir)
+            files = [
+                path
+                for path in files
+                if os.path.relpath(path).replace("\\", "/") in changed_files
+            ]
+        key = None
+        cached = None
+        cache_path = None
+        # files a per-file linter timed out on
+        failed_files = []
+        parse_failed = False
         try:
             if (install or autorun) and config.get("install"):
                 install_linter(config)
-            if config.get("run_per_file"):
-                output = run_per_file(config, ignore_paths, config_dir)
+            if (
+                memo is not None
+                and plan is None
+                and not stop_when
+                and not config.get("run_per_file")
+            ):
+                key = memo_key(linter, config, config_dir, ignore_paths, clean)
+                cached = memo.get(key) if key else None
+            if cached is not None:
+                print(
+                    "Reusing {0} messages from a run on identical files.".format(linter)
+                )
+            elif config.get("run_per_file") and stop_when:
+                # parse as we go so we can stop between batches of files
+                for output in run_per_file_batches(
+                    config,
+                    ignore_paths,
+                    config_dir,
+                    batch_size=PER_FILE_BATCH_SIZE,
+                    stop_when=stop_when,
+                    files=files,
+                    failed=failed_files,
+                ):
+                    parsed = add_output(
+                        messages, linter, config, output, ignore_paths, on_messages
+                    )
+                    parse_failed = parse_failed or parsed is None
+                output = ""
+            elif config.get("run_per_file"):
+                output = run_per_file(
+                    config, ignore_paths, config_dir, files=files, failed=failed_files
+                )
             else:
-                cmd = run_config(config, config_dir)
-                _, output = run_command(cmd)
+                if native_caches:
+                    cmd, env, cache_path = native_cache(linter, config, config_dir)
+                else:
+                    cmd, env = run_config(config, config_dir), None
+                # a timeout looks like a clean run, so it mustn't be remembered as one
+                _, output = run_command(
+                    cmd, raise_on_timeout=bool(key) or failures is not None, env=env
+                )
                 output = output.strip()
+                if cache_path:
+                    print(
+                        "{0} cache: {1} KiB in {2}".format(
+                            linter,
+                            system.directory_size(cache_path) // 1024,
+                            cache_path,
+                        )
+                    )
         except Exception:
             print("Running {0} failed:".format(linter))
             print(traceback.format_exc())
             print("Failed {0} output: {1}".format(linter, output))
+            output = ""
+            key = None
+            if failures is not None:
+                failures.append(linter)
         print(
             "Installation and running of {0} took {1} seconds".format(
                 linter, int(time.time() - start)
@@ -931,24 +1191,207 @@ def lint(
         )
         sys.stdout.flush()
         start = time.time()
-        try:
-            if output:
-                linter_messages = config.get("parser")().parse(output)
-                # prepend linter name to message content
-                linter_messages = {
-                    (msg[0], msg[1], "{0}: {1}".format(linter, msg[2]))
-                    for msg in linter_messages
-                    if not should_ignore_path(msg[0], ignore_paths)
-                }
-                print(
-                    "Found {0} messages from {1}".format(len(linter_messages), linter)
-                )
-                messages.add_messages(linter_messages)
-        except Exception:
-            print("Parsing {0} output failed:".format(linter))
-            print(traceback.format_exc())
-            print(output)
+        if cached is not None:
+            add_parsed(
+                messages,
+                linter,
+                {tuple(msg) for msg in cached["messages"]},
+                on_messages,
+            )
+        else:
+            linter_messages = add_output(
+                messages, linter, config, output, ignore_paths, on_messages
+            )
+            parse_failed = parse_failed or linter_messages is None
+            # a linter killed because we're stopping may have output nothing
+            if key and linter_messages is not None and not system.should_stop():
+                memo.set(key, {"messages": [list(msg) for msg in linter_messages]})
+        if failed_files:
+            print("{0} timed out on {1} files".format(linter, len(failed_files)))
+        if (
+            failures is not None
+            and (failed_files or parse_failed)
+            and linter not in failures
+        ):
+            failures.append(linter)
         print(
             "Parsing of {0} took {1} seconds".format(linter, int(time.time() - start))
         )
+        if stats is not None:
+            stats[linter] = dict(
+                linter_version(config, config_dir),
+                seconds=round(time.time() - linter_start, 3),
+                messages=len(messages.messages) - message_count,
+            )
+    if memo is not None:
+        memo.report()
     return messages.get_messages()
+
+
+def linter_version(config, config_dir=None):
+    """Best effort: the linter's executable and the first line of its --version."""
+    try:
+        executable = run_config(config, config_dir)[0]
+        _, output = run_command([executable, "--version"], timeout=10)
+    except Exception:
+        return {"executable": None, "version": None}
+
+    return {
+        "executable": os.path.basename(executable),
+        "version": (output.strip().splitlines() or [None])[0],
+    }
+
+
+def add_output(messages, linter, config, output, ignore_paths, on_messages=None):
+    """
+    Parse a linter's output into messages.
+
+    Returns the (path, line, message) tuples found, or None if parsing failed.
+    """
+    linter_messages = set()
+    try:
+        if output:
+            linter_messages = config.get("parser")().parse(output)
+            # prepend linter name to message content
+            linter_messages = {
+                (msg[0], msg[1], "{0}: {1}".format(linter, msg[2]))
+                for msg in linter_messages
+                if not should_ignore_path(msg[0], ignore_paths)
+            }
+            add_parsed(messages, linter, linter_messages, on_messages)
+    except Exception:
+        print("Parsing {0} output failed:".format(linter))
+        print(traceback.format_exc())
+        print(output)
+        return None
+
+    return linter_messages
+
+
+def add_parsed(messages, linter, linter_messages, on_messages=None):
+    print("Found {0} messages from {1}".format(len(linter_messages), linter))
+    updated = messages.add_messages(linter_messages)
+    if on_messages and updated:
+        on_messages(updated)
+
+
+def config_hashes(config, config_dir=None):
+    """Content hashes of the linter's dotfiles in the repo, config_dir and our defaults."""
+    hashes = {}
+    default_config_dir = os.path.abspath(os.path.join(HERE, "config"))
+    for label, directory in (
+        ("repo", os.getcwd()),
+        ("config_dir", config_dir),
+        ("default", default_config_dir),
+    ):
+        for dotfile in config.get("dotfiles") or []:
+            path = os.path.join(directory or "", dotfile.strip())
+            if directory and os.path.isfile(path):
+                hashes["{0}/{1}".format(label, dotfile.strip())] = content_hash(path)
+    return hashes
+
+
+def native_cache_dir(linter, config, config_dir=None):
+    """
+    Persistent directory for a linter's own cache in this repo.
+
+    The directory is keyed by the linter's command and config files, so changing either
+    starts from an empty cache. Builds of other branches may still use other configs, so
+    their caches are only deleted once unused for NATIVE_CACHE_MAX_AGE.
+    """
+    try:
+        repo = git.url()
+    except (subprocess.CalledProcessError, OSError):
+        repo = os.getcwd()
+    repo_key = lintcache.make_key(repo)[:16]
+    config_key = lintcache.make_key(
+        run_config(config, config_dir), config_hashes(config, config_dir)
+    )[:16]
+    root = system.cache_dir("native", repo_key, linter)
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        try:
+            unused = time.time() - os.path.getmtime(path)
+        except OSError:
+            continue
+        if name != config_key and unused > NATIVE_CACHE_MAX_AGE:
+            shutil.rmtree(path, ignore_errors=True)
+    path = system.cache_dir("native", repo_key, linter, config_key)
+    # linters rewrite their cache files in place, so mark it as used ourselves
+    os.utime(path, None)
+    return path
+
+
+def native_cache(linter, config, config_dir=None):
+    """
+    Return the command and environment that run a linter with its own cache enabled,
+    and the cache directory.
+
+    Linters declare their cache flags and environment variables in their "cache" entry,
+    with {cache_dir} standing for the directory. Linters without one run unchanged.
+    """
+    cmd = run_config(config, config_dir)
+    cache = config.get("cache")
+    if not cache:
+        return cmd, None, None
+
+    path = native_cache_dir(linter, config, config_dir)
+    cmd = cmd + [arg.format(cache_dir=path) for arg in cache.get("args", [])]
+    env = dict(os.environ)
+    for name, value in cache.get("env", {}).items():
+        env[name] = value.format(cache_dir=path)
+    return cmd, env, path
+
+
+def tree_is_clean():
+    """Check for a working tree without changes, or return None outside of git."""
+    try:
+        return not git.is_dirty([])
+    except (subprocess.CalledProcessError, OSError):
+        return None
+
+
+def memo_key(linter, config, config_dir=None, ignore_paths=None, clean=None):
+    """
+    Key a linter's results by everything that decides them: its command, config files,
+    version, the tracked files it lints and inline-plz's own version.
+
+    Returns None when that can't be pinned down: outside of a git repo, when the working
+    tree has uncommitted or untracked changes, or when we can't tell which version of the
+    linter is installed. Linters also read config files like setup.cfg or a nested
+    .eslintrc that aren't listed in dotfiles, so any change is enough to refuse.
+
+    clean is whether the working tree had no changes before linters were installed,
+    which write node_modules and package files into it. It's checked now if None.
+    """
+    patterns = PATTERNS.get(config.get("language"))
+    dotfiles = [dotfile.strip() for dotfile in config.get("dotfiles") or []]
+    if not patterns:
+        return None
+
+    try:
+        if clean is None:
+            clean = not git.is_dirty([])
+        if not clean:
+            print(
+                "Not reusing {0} results, the working tree has changes.".format(linter)
+            )
+            return None
+
+        files = git.files_hash(patterns + dotfiles + IMPLICIT_CONFIGS)
+    except (subprocess.CalledProcessError, OSError):
+        return None
+
+    version = linter_version(config, config_dir)
+    if not version["version"]:
+        return None
+
+    return lintcache.make_key(
+        linter,
+        run_config(config, config_dir),
+        config_hashes(config, config_dir),
+        version,
+        files,
+        sorted(ignore_paths or []),
+        __version__,
+    )
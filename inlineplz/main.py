@@ -8,27 +8,64 @@ from __future__ import unicode_literals
 import argparse
 import os
 import pprint
+import subprocess
 import sys
+import threading
 import time
 import traceback
 
 import giturlparse
 import yaml
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from inlineplz import baseline
 from inlineplz import interfaces
 from inlineplz import env
+from inlineplz import incremental
 from inlineplz import linters
+from inlineplz import results
 from inlineplz import __version__
+from inlineplz.util import git, lease, lintcache, remotecache, system, tokenpool
 
 
 def main():
     parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "command",
+        nargs="?",
+        choices=["lint", "post", "merge"],
+        help="only lint and save results to --output, only post results from --input, "
+        "or merge --input results files into --output (default: lint and post)",
+    )
+    parser.add_argument("--output", type=str, help="file to save lint results to")
+    parser.add_argument(
+        "--input", type=str, nargs="+", help="lint results files to post or merge"
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        help="INDEX/COUNT: only lint this node's share of the work, counting from 1",
+    )
+    parser.add_argument(
+        "--shard-durations",
+        type=str,
+        help="results file from an earlier run, to balance shards by linter run time",
+    )
     parser.add_argument("--pull-request", type=int)
     parser.add_argument("--owner", type=str)
     parser.add_argument("--repo", type=str)
     parser.add_argument("--repo-slug", type=str)
     parser.add_argument("--branch", type=str)
     parser.add_argument("--token", type=str)
+    parser.add_argument(
+        "--tokens-file",
+        type=str,
+        help="file with more API tokens to rotate between, one per line",
+    )
     parser.add_argument("--commit", type=str, help="commit hash or number")
     parser.add_argument("--interface", type=str, choices=interfaces.INTERFACES)
     parser.add_argument("--url", type=str)
@@ -39,6 +76,84 @@ def main():
     parser.add_argument("--install", action="store_true")
     parser.add_argument("--prefix", type=str, default="[inline-plz]")
     parser.add_argument("--delete-outdated", action="store_true")
+    parser.add_argument(
+        "--batch-review",
+        action="store_true",
+        help="post new comments as a few pull request reviews instead of one by one",
+    )
+    parser.add_argument(
+        "--freshness-interval",
+        default=10,
+        type=float,
+        help="minimum seconds between checks for new commits on the PR while posting",
+    )
+    parser.add_argument(
+        "--no-http-cache",
+        action="store_true",
+        help="don't revalidate GitHub API responses with ETags cached on disk",
+    )
+    parser.add_argument(
+        "--baseline",
+        action="store_true",
+        help="only report messages the PR introduces, by also linting its base commit "
+        "(cached per base commit)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only run per-file linters on files changed since the last commit of the PR "
+        "we reviewed, and keep that review's messages for the other files",
+    )
+    parser.add_argument(
+        "--lease-dir",
+        default=os.environ.get("INLINEPLZ_LEASE_DIR"),
+        help="directory for per-PR lease files, so a newer run for a PR stops older "
+        "ones. Use storage shared by all CI agents",
+    )
+    parser.add_argument(
+        "--lint-cache",
+        action="store_true",
+        help="reuse a linter's messages from an earlier run when its version, config and "
+        "files are unchanged",
+    )
+    parser.add_argument(
+        "--remote-cache",
+        default=os.environ.get(remotecache.REMOTE_CACHE_ENV),
+        help="URL of a cache server to share --lint-cache results between machines "
+        "(see inline-plz-cache-server), implies --lint-cache",
+    )
+    parser.add_argument(
+        "--no-linter-cache",
+        action="store_true",
+        help="don't keep linters' own incremental caches (eslint, pmd and others) "
+        "between runs",
+    )
+    parser.add_argument(
+        "--partial-fetch",
+        action="store_true",
+        help="fetch the PR base without file contents (partial clones only)",
+    )
+    parser.add_argument(
+        "--post-concurrency",
+        default=1,
+        type=int,
+        help="how many comments to create, edit or delete at the same time",
+    )
+    parser.add_argument(
+        "--graphql",
+        action="store_true",
+        help="load the pull request and its review comments with one GraphQL query",
+    )
+    parser.add_argument(
+        "--stream-comments",
+        action="store_true",
+        help="start posting each linter's messages as soon as it finishes",
+    )
+    parser.add_argument(
+        "--stop-at-max-comments",
+        action="store_true",
+        help="stop linting once there are enough postable messages to hit max comments",
+    )
     parser.add_argument(
         "--trusted", action="store_true", help="allow installing all local dependencies"
     )
@@ -54,6 +169,19 @@ def main():
         "--config-dir", help="default directory to search for linter config files"
     )
     args = parser.parse_args()
+    if args.command == "lint" and not args.output:
+        parser.error("lint needs --output")
+    if args.command == "post" and not args.input:
+        parser.error("post needs --input")
+    if args.command == "merge" and not (args.input and args.output):
+        parser.error("merge needs --input and --output")
+    if args.shard and args.command != "lint":
+        # shards only write results, a single post of the merged results owns the status
+        parser.error("--shard only works with lint, post the merged results once")
+    if args.baseline and args.command:
+        parser.error("--baseline needs to know the PR's base commit while linting")
+    if args.incremental and args.command:
+        parser.error("--incremental needs the PR's earlier reviews while linting")
     args = env.update_args(args)
     if args.config_dir:
         args.config_dir = os.path.abspath(args.config_dir)
@@ -70,10 +198,25 @@ def main():
     return result
 
 
+def parse_shard(value):
+    try:
+        index, count = [int(part) for part in value.split("/")]
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected INDEX/COUNT, like 1/4")
+
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError("shard index must be between 1 and COUNT")
+
+    return index, count
+
+
 def update_from_config(args, config):
     blacklist = [
         "trusted",
         "token",
+        "tokens_file",
+        "remote_cache",
+        "lease_dir",
         "interface",
         "owner",
         "repo",
@@ -83,6 +226,10 @@ def update_from_config(args, config):
         "dryrun",
         "url",
         "branch",
+        "command",
+        "input",
+        "output",
+        "shard",
     ]
     for key, value in config.items():
         if not key.startswith("_") and key not in blacklist:
@@ -154,7 +301,78 @@ def inline(args):
     print("Args:")
     pprint.pprint(args)
     ret_code = 0
+    command = args.__dict__.get("command")
+    if command == "lint":
+        return lint_to_file(args, trusted)
+
+    if command == "merge":
+        metadata, messages = results.merge(args.input)
+        results.write(args.output, messages, metadata)
+        print("{} lint messages merged into {}".format(len(messages), args.output))
+        return 0
+
+    loaded = None
+    if command == "post":
+        metadata, loaded = results.merge(args.input)
+        print(
+            "Loaded {} lint messages from {}".format(len(loaded), ", ".join(args.input))
+        )
+        # post against the commit that was linted, not whatever is checked out here
+        args.commit = metadata.get("commit") or args.commit
+
+    run_lease = None
+    if args.__dict__.get("lease_dir") and (args.pull_request or args.branch):
+        run_lease = take_lease(args)
+        if not run_lease:
+            return ret_code
+
+    watcher = lease.LeaseWatcher(run_lease) if run_lease else None
+    if watcher:
+        watcher.start()
+    try:
+        return review(args, trusted, loaded, run_lease)
+    finally:
+        if watcher:
+            watcher.stop()
+
+
+def take_lease(args):
+    """Take the PR's lease from older runs, or return None if a newer run holds it."""
+    if not os.path.isdir(args.lease_dir):
+        os.makedirs(args.lease_dir)
+    sha = args.commit
+    if not sha:
+        try:
+            sha = git.current_sha()
+        except (subprocess.CalledProcessError, OSError):
+            sha = None
+    run_lease = lease.Lease(
+        lease.lease_path(
+            args.lease_dir,
+            args.url,
+            args.repo_slug or "{}/{}".format(args.owner, args.repo),
+            str(args.pull_request or args.branch),
+        ),
+        sha,
+    )
+    if not run_lease.acquire():
+        print(
+            "A run for newer commit {} holds the lease, skipping this one.".format(
+                run_lease.holder.get("sha")
+            )
+        )
+        return None
+
+    return run_lease
+
+
+def review(args, trusted, loaded=None, run_lease=None):
+    """
+    Lint, unless loaded has messages from an earlier lint, and post the results.
 
+    run_lease is this run's Lease, if any. Posting is skipped once a newer run takes it.
+    """
+    ret_code = 0
     # TODO: consider moving this git parsing stuff into the github interface
     url = args.url
     if args.repo_slug:
@@ -184,9 +402,11 @@ def inline(args):
         return 1
 
     print("Using interface: {0}".format(args.interface))
-    my_interface = None
+    setup = None
     if not args.dryrun:
-        my_interface = interfaces.INTERFACES[args.interface](
+        # talking to the scm host doesn't depend on linting, so do both at once
+        setup = InterfaceSetup(
+            interfaces.INTERFACES[args.interface],
             owner,
             repo,
             args.pull_request,
@@ -196,47 +416,159 @@ def inline(args):
             args.commit,
             args.ignore_paths,
             args.prefix,
+            batch_review=args.batch_review,
+            # the lease tells us about newer runs, the API only needs checking now and then
+            freshness_interval=(
+                args.freshness_interval
+                if run_lease is None
+                else max(args.freshness_interval, lease.LEASED_FRESHNESS_INTERVAL)
+            ),
+            http_cache=not args.no_http_cache,
+            partial_fetch=args.partial_fetch,
+            post_concurrency=args.post_concurrency,
+            graphql=args.graphql,
+            tokens=tokenpool.load_tokens(args.token, args.tokens_file),
         )
-        if not my_interface.is_valid():
-            print("Invalid review. Exiting.")
-            return 0
+        setup.start()
+    stream = None
+    if setup and args.stream_comments and loaded is None:
+        stream = CommentStream(setup, args.max_comments)
+        stream.start()
+    budget = None
+    if setup and args.stop_at_max_comments and args.max_comments and loaded is None:
+        budget = CommentBudget(setup, args.max_comments)
+    listeners = [
+        listener
+        for listener in (stream and stream.put, budget and budget.add)
+        if listener
+    ]
+    base = None
+    if setup and args.__dict__.get("baseline") and loaded is None:
+        base = load_baseline(args, trusted, setup)
+    previous = None
+    if setup and args.__dict__.get("incremental") and loaded is None:
+        previous = load_previous_review(args, setup)
+    changed_files = base.changed_files() if base else None
+    if previous:
+        changed_files = (
+            previous.changed_files
+            if changed_files is None
+            else changed_files & previous.changed_files
+        )
+
+    def on_messages(updated):
+        if base:
+            updated = base.new_messages(updated)
+        for listener in listeners:
+            listener(updated)
 
-        my_interface.start_review()
+    if setup:
+        # without a review to post to there's no point in finishing linting
+        system.add_stop_check(setup.failed)
+    failures = []
     try:
-        messages = linters.lint(
-            args.install,
-            args.autorun,
-            args.ignore_paths,
-            args.config_dir,
-            args.enabled_linters,
-            args.disabled_linters,
-            trusted,
-        )
+        messages = loaded
+        if messages is None:
+            messages = linters.lint(
+                args.install,
+                args.autorun,
+                args.ignore_paths,
+                args.config_dir,
+                args.enabled_linters,
+                args.disabled_linters,
+                trusted,
+                on_messages=on_messages if listeners else None,
+                stop_when=budget.full if budget else None,
+                memo=lint_memo(args),
+                native_caches=not args.no_linter_cache,
+                changed_files=changed_files,
+                failures=failures,
+            )
+            if previous:
+                messages, carried = incremental.merge(messages, previous.carried_over())
+                print(
+                    "{} lint messages carried over from {}".format(
+                        len(carried), previous.sha
+                    )
+                )
+                if listeners and carried:
+                    on_messages(carried)
+            if setup and args.__dict__.get("incremental") and loaded is None:
+                save_review(args, setup, messages, budget, failures)
+            if base:
+                found = len(messages)
+                messages = base.new_messages(messages)
+                print(
+                    "{} lint messages were already on the base commit".format(
+                        found - len(messages)
+                    )
+                )
     except Exception:  # pylint: disable=broad-except
         print("Linting failed:\n{}".format(traceback.format_exc()))
         print("inline-plz version: {}".format(__version__))
         print("Python version: {}".format(sys.version))
         ret_code = 1
-        my_interface.finish_review(error=True)
+        if stream:
+            stream.close()
+            stream.join()
+        if setup:
+            setup.join()
+            setup.finish_with_error()
         return ret_code
+    finally:
+        if setup:
+            system.remove_stop_check(setup.failed)
 
     print("{} lint messages found".format(len(messages)))
     print("inline-plz version: {}".format(__version__))
     print("Python version: {}".format(sys.version))
 
+    if run_lease and run_lease.superseded():
+        print("A newer run took over, not posting.")
+        if stream:
+            stream.close()
+            stream.join()
+        return ret_code
+
     # TODO: implement dryrun as an interface instead of a special case here
 
     if args.dryrun:
         print_messages(messages)
         return ret_code
 
+    if stream:
+        # the final status waits until everything queued has been posted
+        stream.close()
+        stream.join()
+    setup.join()
+    my_interface = setup.interface
+    if setup.error:
+        print("Interface setup failed:\n{}".format(setup.error))
+        setup.finish_with_error()
+        return 1
+
+    if not my_interface.is_valid():
+        print("Invalid review. Exiting.")
+        return 0
+
+    if stream and stream.error:
+        print("Posting failed:\n{}".format(stream.error))
+        setup.finish_with_error()
+        return 1
+
     try:
-        if my_interface.post_messages(messages, args.max_comments):
+        if stream:
+            found_errors = stream.result
+        else:
+            found_errors = my_interface.post_messages(messages, args.max_comments)
+        truncated = bool(budget and budget.truncated)
+        if found_errors:
             if not args.zero_exit:
                 ret_code = 1
-            if args.delete_outdated:
+            # comments from linters we skipped aren't outdated, we just didn't look
+            if args.delete_outdated and not truncated:
                 my_interface.clear_outdated_messages()
-            my_interface.finish_review(success=False)
+            my_interface.finish_review(success=False, truncated=truncated)
             return ret_code
 
         if args.delete_outdated:
@@ -248,6 +580,269 @@ def inline(args):
     return ret_code
 
 
+def load_baseline(args, trusted, setup):
+    """Wait for the PR lookup and load its base commit's messages, or return None."""
+    setup.join()
+    interface = setup.interface
+    if (
+        setup.error
+        or not (interface and interface.is_valid())
+        or not getattr(interface, "diff_index", None)
+    ):
+        print("No base commit to compare with, reporting all messages.")
+        return None
+
+    def lint_base(failures):
+        return linters.lint(
+            args.install,
+            args.autorun,
+            args.ignore_paths,
+            args.config_dir,
+            args.enabled_linters,
+            args.disabled_linters,
+            trusted,
+            memo=lint_memo(args),
+            native_caches=not args.no_linter_cache,
+            failures=failures,
+        )
+
+    try:
+        return baseline.load(
+            interface.target_sha,
+            interface.diff_index,
+            lint_memo(args) or lintcache.LintCache(),
+            baseline.cache_key(interface.target_sha, args),
+            lint_base,
+        )
+    except Exception:  # pylint: disable=broad-except
+        print(
+            "Baseline failed, reporting all messages:\n{}".format(
+                traceback.format_exc()
+            )
+        )
+        return None
+
+
+def load_previous_review(args, setup):
+    """Wait for the PR lookup and find an earlier review to build on, or return None."""
+    setup.join()
+    interface = setup.interface
+    if setup.error or not (interface and interface.is_valid()):
+        return None
+
+    try:
+        return incremental.load(
+            interface,
+            interface.last_sha,
+            lint_memo(args) or lintcache.LintCache(),
+            args,
+        )
+    except Exception:  # pylint: disable=broad-except
+        print(
+            "Finding an earlier review failed, reviewing everything:\n{}".format(
+                traceback.format_exc()
+            )
+        )
+        return None
+
+
+def save_review(args, setup, messages, budget, failures=None):
+    """
+    Keep complete results so the next review of this PR can build on them.
+
+    failures are the linters that failed or timed out, whose files would otherwise be
+    carried over as clean until they change.
+    """
+    interface = setup.interface
+    if not (interface and interface.is_valid()):
+        return
+
+    if (budget and budget.truncated) or system.should_stop():
+        return
+
+    if failures:
+        print("Not saving this review, {0} failed".format(", ".join(failures)))
+        return
+
+    incremental.save(
+        lint_memo(args) or lintcache.LintCache(), interface.last_sha, args, messages
+    )
+
+
+def lint_memo(args):
+    """The cache for linters to reuse earlier results from, if enabled."""
+    if args.__dict__.get("remote_cache"):
+        return remotecache.RemoteCache(args.remote_cache, local=lintcache.LintCache())
+
+    if args.__dict__.get("lint_cache"):
+        return lintcache.LintCache()
+
+    return None
+
+
+def lint_to_file(args, trusted):
+    """Lint and save the results to args.output for a later `inline-plz post`."""
+    start = time.time()
+    stats = {}
+    shard = args.__dict__.get("shard")
+    durations = None
+    if shard and args.__dict__.get("shard_durations"):
+        durations = results.durations(args.shard_durations)
+    try:
+        messages = linters.lint(
+            args.install,
+            args.autorun,
+            args.ignore_paths,
+            args.config_dir,
+            args.enabled_linters,
+            args.disabled_linters,
+            trusted,
+            stats=stats,
+            shard=shard,
+            durations=durations,
+            memo=lint_memo(args),
+            native_caches=not args.no_linter_cache,
+        )
+    except Exception:  # pylint: disable=broad-except
+        print("Linting failed:\n{}".format(traceback.format_exc()))
+        return 1
+
+    results.write(
+        args.output,
+        messages,
+        {
+            "commit": args.commit,
+            "inline_plz_version": __version__,
+            "linters": stats,
+            "seconds": round(time.time() - start, 3),
+            "shard": "{0}/{1}".format(*shard) if shard else None,
+        },
+    )
+    print("{} lint messages saved to {}".format(len(messages), args.output))
+    return 0
+
+
+class InterfaceSetup(threading.Thread):
+    def __init__(self, interface_class, *args, **kwargs):
+        """
+        Build a review interface and mark the review as started, in the background.
+
+        Call join() before using interface. If anything went wrong, error holds the
+        traceback.
+        """
+        super(InterfaceSetup, self).__init__()
+        self.daemon = True
+        self.interface_class = interface_class
+        self.args = args
+        self.kwargs = kwargs
+        self.interface = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.interface = self.interface_class(*self.args, **self.kwargs)
+            if self.interface.is_valid():
+                self.interface.start_review()
+        except Exception:  # pylint: disable=broad-except
+            self.error = traceback.format_exc()
+
+    def failed(self):
+        """Check if setup is done and there's no valid review to post to."""
+        if self.is_alive():
+            return False
+
+        return bool(self.error or not (self.interface and self.interface.is_valid()))
+
+    def finish_with_error(self):
+        """Report an error status, if we got far enough to have a review to report on."""
+        if not (self.interface and self.interface.is_valid()):
+            return
+
+        try:
+            self.interface.finish_review(error=True)
+        except Exception:  # pylint: disable=broad-except
+            traceback.print_exc()
+
+
+class CommentStream(threading.Thread):
+    def __init__(self, setup, max_comments):
+        """
+        Post messages as each linter finishes instead of after all of them.
+
+        Messages are put() from the linting thread and posted once setup is done. Call
+        close() after the last put() and join() before reading result.
+        """
+        super(CommentStream, self).__init__()
+        self.daemon = True
+        self.setup = setup
+        self.max_comments = max_comments
+        self.queue = queue.Queue()
+        self.result = None
+        self.error = None
+
+    def put(self, messages):
+        # linting keeps adding to these messages while we post, so post copies
+        self.queue.put([msg.copy() for msg in messages])
+
+    def close(self):
+        self.queue.put(None)
+
+    def run(self):
+        self.setup.join()
+        interface = self.setup.interface
+        posting = bool(not self.setup.error and interface and interface.is_valid())
+        try:
+            if posting:
+                interface.begin_posting(self.max_comments)
+            while True:
+                messages = self.queue.get()
+                if messages is None:
+                    break
+
+                if posting:
+                    interface.queue_messages(messages)
+            if posting:
+                self.result = interface.end_posting()
+        except Exception:  # pylint: disable=broad-except
+            self.error = traceback.format_exc()
+
+
+class CommentBudget(object):
+    def __init__(self, setup, max_comments):
+        """
+        Tell linting when there are enough postable messages to use up max_comments.
+
+        Only messages on lines changed by the PR can be posted, so this needs the
+        interface's diff and waits for setup the first time there might be enough.
+        """
+        self.setup = setup
+        # post_messages has always posted one comment past max_comments
+        self.budget = max_comments + 1
+        self.unchecked = []
+        self.positions = set()
+        self.truncated = False
+
+    def add(self, messages):
+        self.unchecked.extend(messages)
+
+    def full(self):
+        if len(self.positions) + len(self.unchecked) < self.budget:
+            return self.truncated
+
+        self.setup.join()
+        interface = self.setup.interface
+        if self.setup.error or not (interface and interface.is_valid()):
+            return False
+
+        for msg in self.unchecked:
+            msg_position = interface.postable_position(msg)
+            if msg_position:
+                self.positions.add((msg.path, msg_position))
+        self.unchecked = []
+        self.truncated = len(self.positions) >= self.budget
+        return self.truncated
+
+
 def print_messages(messages):
     for msg in sorted([str(msg) for msg in messages]):
         print(msg)
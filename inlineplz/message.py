@@ -9,6 +9,16 @@ import os
 import traceback
 
 
+def normalize(message, line):
+    """
+    Replace line numbers to improve deduping. We're commenting inline anyway, so line
+    numbers don't really matter.
+    """
+    if line > 1:
+        message = message.replace(str(line), "_")
+    return message
+
+
 class Messages(object):
     def __init__(self):
         self.messages = {}
@@ -23,23 +33,28 @@ class Messages(object):
             line = 1
         if line <= 0:
             line = 1
-        # replace line numbers to improve deduping. we're commenting inline anyway,
-        # so line numbers don't really matter
-        if line > 1:
-            message = message.replace(str(line), "_")
+        original = message
+        message = normalize(message, line)
         if (path, line) not in self.messages:
             try:
                 self.messages[(path, line)] = Message(path, line)
             except TypeError:
                 print("{0} {1} {2}".format(path, line, message))
                 print(traceback.format_exc())
-                return
+                return None
 
         self.messages[(path, line)].append(message)
+        self.messages[(path, line)].originals[message] = original
+        return self.messages[(path, line)]
 
     def add_messages(self, messages):
+        """Add (path, line, message) tuples and return the Messages they ended up in."""
+        updated = set()
         for message in messages:
-            self.add_message(*message)
+            msg = self.add_message(*message)
+            if msg:
+                updated.add(msg)
+        return updated
 
     def get_messages(self):
         return self.messages.values()
@@ -50,6 +65,8 @@ class Message(object):
         self.path = os.path.relpath(path).replace("\\", "/")
         self.line_number = int(line_number)
         self.comments = set()
+        # comment -> the linter's text before normalize(), when we have it
+        self.originals = dict()
 
     def __str__(self):
         return """
@@ -57,9 +74,13 @@ Message:
     Path: {0}
     Line number: {1}
     Content: {2}
-        """.format(
-            self.path, self.line_number, self.comments
-        ).strip()
+        """.format(self.path, self.line_number, self.comments).strip()
 
     def append(self, message):
         self.comments.add(message)
+
+    def copy(self):
+        msg = Message(self.path, self.line_number)
+        msg.comments = set(self.comments)
+        msg.originals = dict(self.originals)
+        return msg
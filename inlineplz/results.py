@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""
+Save lint results to a file and load them back, so linting and posting can run separately.
+
+Results are JSON lines, gzipped if the path ends in .gz. The first line holds metadata
+(commit, linter versions and timings) and every other line is one message.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import gzip
+import io
+import json
+
+from inlineplz import message
+
+FORMAT_VERSION = 1
+
+
+def open_results(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+
+    return io.open(path, mode, encoding="utf-8")
+
+
+def write(path, messages, metadata):
+    """Write metadata and messages, sorted so identical results give identical files."""
+    metadata = dict(metadata, format_version=FORMAT_VERSION)
+    with open_results(path, "w") as results_file:
+        results_file.write(json.dumps(metadata, sort_keys=True) + "\n")
+        for msg in sorted(messages, key=lambda msg: (msg.path, msg.line_number)):
+            results_file.write(
+                json.dumps(
+                    {
+                        "path": msg.path,
+                        "line": msg.line_number,
+                        "comments": sorted(msg.comments),
+                    }
+                )
+                + "\n"
+            )
+
+
+def read(path):
+    """Return the metadata and messages saved by write()."""
+    messages = []
+    with open_results(path, "r") as results_file:
+        metadata = json.loads(results_file.readline())
+        if metadata.get("format_version") != FORMAT_VERSION:
+            raise ValueError(
+                "Unsupported results format: {}".format(metadata.get("format_version"))
+            )
+
+        for line in results_file:
+            if not line.strip():
+                continue
+
+            data = json.loads(line)
+            msg = message.Message(data["path"], data["line"])
+            msg.comments = set(data["comments"])
+            messages.append(msg)
+    return metadata, messages
+
+
+def merge(paths):
+    """
+    Combine results files, such as one per shard, into one set of metadata and messages.
+
+    Comments on the same line from different files end up in one message, and linter run
+    times are summed so the merged file can balance the next sharded run.
+    """
+    messages = message.Messages()
+    metadata = {"linters": {}, "merged": []}
+    for path in paths:
+        file_metadata, file_messages = read(path)
+        commit = file_metadata.get("commit")
+        if metadata.get("commit") and commit and commit != metadata["commit"]:
+            raise ValueError(
+                "{} is for commit {}, not {}".format(path, commit, metadata["commit"])
+            )
+
+        metadata["commit"] = metadata.get("commit") or commit
+        metadata["inline_plz_version"] = file_metadata.get("inline_plz_version")
+        metadata["merged"].append(file_metadata.get("shard") or path)
+        for linter, stats in file_metadata.get("linters", {}).items():
+            if linter not in metadata["linters"]:
+                metadata["linters"][linter] = dict(stats)
+                continue
+
+            # per-file linters are split across shards
+            merged_stats = metadata["linters"][linter]
+            for key in ("seconds", "messages"):
+                merged_stats[key] = merged_stats.get(key, 0) + stats.get(key, 0)
+        for msg in file_messages:
+            for comment in msg.comments:
+                messages.add_message(msg.path, msg.line_number, comment)
+    return metadata, list(messages.get_messages())
+
+
+def durations(path):
+    """Linter run times recorded in a results file, for shard_plan."""
+    metadata, _ = read(path)
+    return {
+        linter: stats.get("seconds")
+        for linter, stats in metadata.get("linters", {}).items()
+    }
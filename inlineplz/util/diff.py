@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+"""
+Minimal unified diff reader.
+
+Only keeps what we need to post review comments: renames, hunk headers, the target line
+number and diff position of every added line and where each context line moved to.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import codecs
+import re
+
+DEV_NULL = "/dev/null"
+
+RE_DIFF_GIT_HEADER = re.compile(r"^diff --git (?P<source>.+) (?P<target>.+)$")
+RE_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+def unquote_path(path, prefix):
+    """Undo git's C-style path quoting and strip the a/ or b/ prefix."""
+    path = path.strip()
+    if path.startswith('"') and path.endswith('"'):
+        path = codecs.escape_decode(path[1:-1].encode("utf-8"))[0].decode(
+            "utf-8", errors="replace"
+        )
+    if path.startswith(prefix):
+        path = path[len(prefix) :]
+    return path
+
+
+class PatchedFile(object):
+    def __init__(self, source, target):
+        self.source = source
+        self.target = target
+        # (source start, source length, target start, target length)
+        self.hunks = []
+        # target line number -> position
+        self.added = dict()
+        # source line number -> target line number, for unchanged lines inside hunks
+        self.context = dict()
+
+    @property
+    def is_rename(self):
+        return (
+            self.source is not None
+            and self.target is not None
+            and self.source != self.target
+        )
+
+
+class DiffIndex(object):
+    def __init__(self, lines):
+        """
+        Index a unified diff, as produced by `git diff`.
+
+        lines is any iterable of diff lines without trailing newlines, so the diff can be
+        streamed straight from git without holding all of it in memory.
+        """
+        # target path -> PatchedFile
+        self.files = dict()
+        self._source_files = None
+        self._parse(lines)
+
+    def position(self, path, line_number):
+        """Return the diff position of an added line, or None."""
+        patched_file = self.files.get(path)
+        if not patched_file:
+            return None
+
+        return patched_file.added.get(line_number)
+
+    def map_line(self, source_path, line_number):
+        """
+        Return the (path, line number) a line of the source side ends up at, or None if
+        the diff removes it.
+        """
+        patched_file = self._by_source().get(source_path)
+        if not patched_file:
+            return source_path, line_number
+
+        offset = 0
+        for hunk in patched_file.hunks:
+            source_start, source_length, target_start, target_length = hunk
+            # an empty side's start is the line before the hunk
+            if not source_length:
+                source_start += 1
+            if not target_length:
+                target_start += 1
+            if line_number < source_start:
+                break
+
+            if line_number < source_start + source_length:
+                target_line = patched_file.context.get(line_number)
+                if target_line is None:
+                    return None
+
+                return patched_file.target, target_line
+
+            offset = (target_start + target_length) - (source_start + source_length)
+        return patched_file.target, line_number + offset
+
+    def _by_source(self):
+        if self._source_files is None:
+            self._source_files = {
+                patched_file.source: patched_file
+                for patched_file in self.files.values()
+                if patched_file.source is not None
+            }
+        return self._source_files
+
+    def renames(self):
+        return {
+            patched_file.target: patched_file.source
+            for patched_file in self.files.values()
+            if patched_file.is_rename
+        }
+
+    def _add_file(self, patched_file):
+        if patched_file and patched_file.target is not None:
+            self.files.setdefault(patched_file.target, patched_file)
+
+    def _parse(self, lines):
+        current = None
+        source_left = target_left = 0
+        source_line = target_line = 0
+        position = 0
+        in_hunk = False
+        for line in lines:
+            if source_left > 0 or target_left > 0:
+                line_type = line[:1] or " "
+                if line_type in "+- \\":
+                    position += 1
+                    if line_type == "+":
+                        current.added[target_line] = position
+                        target_line += 1
+                        target_left -= 1
+                    elif line_type == "-":
+                        source_line += 1
+                        source_left -= 1
+                    elif line_type == " ":
+                        current.context[source_line] = target_line
+                        source_line += 1
+                        target_line += 1
+                        source_left -= 1
+                        target_left -= 1
+                    continue
+
+                # hunk is shorter than its header claims, treat this as a header line
+                source_left = target_left = 0
+
+            if line.startswith("\\"):
+                # "\ No newline at end of file" still counts as a line of the last hunk
+                if in_hunk:
+                    position += 1
+                continue
+
+            hunk_header = RE_HUNK_HEADER.match(line)
+            if hunk_header and current:
+                source_start, source_length, target_start, target_length = [
+                    int(group) if group is not None else 1
+                    for group in hunk_header.groups()
+                ]
+                current.hunks.append(
+                    (source_start, source_length, target_start, target_length)
+                )
+                if in_hunk:
+                    # every hunk header after the first takes up a position
+                    position += 1
+                in_hunk = True
+                source_left = source_length
+                target_left = target_length
+                source_line = source_start
+                target_line = target_start
+                continue
+
+            git_header = RE_DIFF_GIT_HEADER.match(line)
+            if git_header:
+                self._add_file(current)
+                current = PatchedFile(
+                    unquote_path(git_header.group("source"), "a/"),
+                    unquote_path(git_header.group("target"), "b/"),
+                )
+                position = 0
+                in_hunk = False
+            elif not current:
+                continue
+            elif line.startswith("rename from "):
+                current.source = unquote_path(line[len("rename from ") :], "")
+            elif line.startswith("rename to "):
+                current.target = unquote_path(line[len("rename to ") :], "")
+            elif line.startswith("new file mode"):
+                current.source = None
+            elif line.startswith("deleted file mode"):
+                current.target = None
+            elif line.startswith("--- "):
+                source = line[len("--- ") :].split("\t")[0]
+                current.source = (
+                    None if source == DEV_NULL else unquote_path(source, "a/")
+                )
+            elif line.startswith("+++ "):
+                target = line[len("+++ ") :].split("\t")[0]
+                current.target = (
+                    None if target == DEV_NULL else unquote_path(target, "b/")
+                )
+        self._add_file(current)
@@ -1,7 +1,14 @@
 # -*- coding: utf-8 -*-
+from __future__ import print_function
 from __future__ import unicode_literals
 
+import contextlib
+import hashlib
+import os
+import shutil
 import subprocess
+import tempfile
+import time
 
 
 def current_sha():
@@ -49,3 +56,166 @@ def fetch(git_url):
         .strip()
         .decode("utf-8", errors="replace")
     )
+
+
+def files_hash(pathspecs):
+    """
+    Hash the index entries (mode, blob sha and path) of tracked files matching pathspecs.
+
+    With a clean working tree this identifies their content like a tree sha would.
+    """
+    listing = subprocess.check_output(["git", "ls-files", "-s", "--"] + list(pathspecs))
+    return hashlib.sha1(listing).hexdigest()
+
+
+def is_dirty(pathspecs):
+    """
+    Check for staged, unstaged or untracked changes to files matching pathspecs.
+
+    An empty list of pathspecs checks the whole working tree.
+    """
+    return bool(
+        subprocess.check_output(
+            ["git", "status", "--porcelain", "--untracked-files=all", "--"]
+            + list(pathspecs)
+        ).strip()
+    )
+
+
+@contextlib.contextmanager
+def worktree(sha):
+    """Check out sha in a temporary worktree, yielding its path and removing it after."""
+    parent = tempfile.mkdtemp(prefix="inlineplz-")
+    path = os.path.join(parent, "worktree")
+    subprocess.check_call(["git", "worktree", "add", "--detach", path, sha])
+    try:
+        yield path
+    finally:
+        subprocess.call(["git", "worktree", "remove", "--force", path])
+        shutil.rmtree(parent, ignore_errors=True)
+
+
+def changed_files(start, end):
+    """Paths added, modified or deleted between two commits, renames as both paths."""
+    output = subprocess.check_output(
+        ["git", "diff", "--name-only", "--no-renames", "{}..{}".format(start, end)]
+    )
+    return set(output.decode("utf-8", errors="replace").splitlines())
+
+
+def diff_lines(start, end):
+    """Stream `git diff` output line by line instead of buffering the whole diff."""
+    proc = subprocess.Popen(
+        ["git", "diff", "-M", "{}..{}".format(start, end)], stdout=subprocess.PIPE
+    )
+    try:
+        for line in proc.stdout:
+            yield line.decode("utf-8", errors="replace").rstrip("\n")
+    finally:
+        proc.stdout.close()
+        returncode = proc.wait()
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, proc.args)
+
+
+def is_ancestor(ancestor, sha):
+    """Check if ancestor is sha or one of its ancestors. False if either is unknown."""
+    with open(os.devnull, "w") as devnull:
+        return (
+            subprocess.call(
+                ["git", "merge-base", "--is-ancestor", ancestor, sha],
+                stdout=devnull,
+                stderr=devnull,
+            )
+            == 0
+        )
+
+
+def has_commit(sha):
+    with open(os.devnull, "w") as devnull:
+        return (
+            subprocess.call(
+                ["git", "cat-file", "-e", "{}^{{commit}}".format(sha)],
+                stdout=devnull,
+                stderr=devnull,
+            )
+            == 0
+        )
+
+
+def object_store_kib():
+    """Size of the local object store in KiB, loose objects and packs combined."""
+    stats = dict(
+        line.split(": ", 1)
+        for line in subprocess.check_output(["git", "count-objects", "-v"])
+        .decode("utf-8", errors="replace")
+        .splitlines()
+        if ": " in line
+    )
+    return int(stats.get("size", 0)) + int(stats.get("size-pack", 0))
+
+
+def is_shallow():
+    try:
+        return (
+            subprocess.check_output(["git", "rev-parse", "--is-shallow-repository"])
+            .strip()
+            .decode("utf-8", errors="replace")
+            == "true"
+        )
+
+    except subprocess.CalledProcessError:
+        return False
+
+
+def partial_clone_remote():
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "config", "--get", "extensions.partialclone"]
+            )
+            .strip()
+            .decode("utf-8", errors="replace")
+        )
+
+    except subprocess.CalledProcessError:
+        return None
+
+
+def fetch_commit(git_url, sha, depth=1, blob_filter=False):
+    """
+    Make sure a single commit is available locally, fetching as little as possible.
+
+    Nothing is fetched if the commit is already in the object store. Otherwise only that
+    commit is fetched, limited to the given depth in shallow clones (full clones stay
+    full, they just negotiate against the history they already have). blob_filter
+    skips fetching file contents up front, which only works in partial clones, so it's
+    ignored everywhere else. Falls back to a plain fetch of the remote if the server
+    won't serve the commit directly.
+    """
+    if has_commit(sha):
+        print("Commit {} is already available locally.".format(sha))
+        return ""
+
+    start = time.time()
+    size_before = object_store_kib()
+    remote = git_url
+    cmd = ["git", "fetch", "--no-tags"]
+    if is_shallow():
+        cmd.append("--depth={}".format(depth))
+    if blob_filter:
+        promisor = partial_clone_remote()
+        if promisor:
+            remote = promisor
+            cmd.append("--filter=blob:none")
+    try:
+        output = subprocess.check_output(cmd + [remote, sha])
+    except subprocess.CalledProcessError:
+        print("Fetching {} directly failed, fetching {}".format(sha, git_url))
+        output = subprocess.check_output(["git", "fetch", git_url])
+    print(
+        "Fetched {} in {:.1f} seconds, {} KiB transferred".format(
+            sha, time.time() - start, max(object_store_kib() - size_before, 0)
+        )
+    )
+    return output.strip().decode("utf-8", errors="replace")
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+"""
+Conditional request cache for the GitHub API.
+
+GitHub doesn't count 304 Not Modified responses against the rate limit, so we remember
+the ETag/Last-Modified of every GET response on disk and revalidate instead of refetching.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import traceback
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from inlineplz.util import system
+
+MAX_ENTRIES = 5000
+VALIDATOR_HEADERS = ("If-None-Match", "If-Modified-Since")
+# these describe the encoded body on the wire, not the decoded content we store
+ENCODING_HEADERS = ("content-length", "content-encoding", "transfer-encoding")
+
+
+class DiskCache(object):
+    def __init__(self, path, max_entries=None):
+        """
+        JSON entries stored one file per key under path.
+
+        With max_entries, reads mark an entry as recently used and writes evict the least
+        recently used entries beyond that many.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        # entries on disk, counted on the first write and then kept up to date
+        self.entries = None
+        self.lock = threading.Lock()
+
+    def _filename(self, key):
+        return os.path.join(self.path, key + ".json")
+
+    def get(self, key):
+        try:
+            with open(self._filename(key)) as cachefile:
+                entry = json.load(cachefile)
+        except (IOError, OSError, ValueError):
+            return None
+
+        if self.max_entries:
+            try:
+                # mark as recently used
+                os.utime(self._filename(key), None)
+            except OSError:
+                pass
+        return entry
+
+    def set(self, key, entry):
+        try:
+            is_new = not os.path.exists(self._filename(key))
+            handle, tmp_path = tempfile.mkstemp(dir=self.path)
+            with os.fdopen(handle, "w") as cachefile:
+                json.dump(entry, cachefile)
+            os.replace(tmp_path, self._filename(key))
+        except (IOError, OSError):
+            traceback.print_exc()
+            return
+
+        if not self.max_entries:
+            return
+        with self.lock:
+            if self.entries is None:
+                self.entries = len(self._entries())
+            elif is_new:
+                self.entries += 1
+            if self.entries > self.max_entries:
+                self.evict()
+
+    def _entries(self):
+        return [
+            os.path.join(self.path, name)
+            for name in os.listdir(self.path)
+            if name.endswith(".json")
+        ]
+
+    def evict(self):
+        try:
+            entries = self._entries()
+            entries.sort(key=os.path.getmtime)
+            for filename in entries[: max(len(entries) - self.max_entries, 0)]:
+                os.remove(filename)
+            self.entries = min(len(entries), self.max_entries)
+        except OSError:
+            traceback.print_exc()
+            self.entries = None
+
+
+class CachingAdapter(HTTPAdapter):
+    def __init__(self, cache, *args, **kwargs):
+        """
+        HTTPAdapter that turns repeated GETs into conditional requests.
+
+        A 304 response is swapped for the stored 200 response, with the fresh headers
+        (rate limit counters and the like) merged on top.
+        """
+        super(CachingAdapter, self).__init__(*args, **kwargs)
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.saved = 0
+
+    @staticmethod
+    def cache_key(request):
+        # responses differ per user and media type, so those are part of the key
+        key = "\n".join(
+            [
+                request.url,
+                request.headers.get("Authorization", ""),
+                request.headers.get("Accept", ""),
+            ]
+        )
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def send(self, request, **kwargs):
+        if (
+            request.method != "GET"
+            or kwargs.get("stream")
+            or any(header in request.headers for header in VALIDATOR_HEADERS)
+        ):
+            return super(CachingAdapter, self).send(request, **kwargs)
+
+        key = self.cache_key(request)
+        entry = self.cache.get(key)
+        if entry:
+            if entry.get("etag"):
+                request.headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                request.headers["If-Modified-Since"] = entry["last_modified"]
+        response = super(CachingAdapter, self).send(request, **kwargs)
+        with self.lock:
+            self.requests += 1
+            if entry and response.status_code == 304:
+                self.saved += 1
+                return self.cached_response(request, response, entry)
+
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if response.status_code == 200 and (etag or last_modified):
+            self.cache.set(
+                key,
+                {
+                    "etag": etag,
+                    "last_modified": last_modified,
+                    "headers": {
+                        header: value
+                        for header, value in response.headers.items()
+                        if header.lower() not in ENCODING_HEADERS
+                    },
+                    "content": base64.b64encode(response.content).decode("ascii"),
+                },
+            )
+        return response
+
+    @staticmethod
+    def cached_response(request, not_modified, entry):
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        for header, value in not_modified.headers.items():
+            if header.lower() not in ENCODING_HEADERS:
+                response.headers[header] = value
+        response._content = base64.b64decode(entry["content"])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.elapsed = not_modified.elapsed
+        response.connection = not_modified.connection
+        return response
+
+    def report(self):
+        print(
+            "HTTP cache: {} of {} GET requests were answered from cache.".format(
+                self.saved, self.requests
+            )
+        )
+
+
+def install(session, path=None, **adapter_kwargs):
+    """Mount a CachingAdapter on a requests session and return it."""
+    adapter = CachingAdapter(
+        DiskCache(path or system.cache_dir("http"), max_entries=MAX_ENTRIES),
+        **adapter_kwargs
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return adapter
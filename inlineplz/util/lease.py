@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+"""
+Let the newest inline-plz run for a pull request cancel older ones.
+
+Every run writes its id into the pull request's lease file when it starts, taking the
+lease over from any older run. Runs watch the file, which is cheap to read compared to
+asking the API whether the pull request moved on, and stop once someone else holds it.
+Put the lease directory on storage shared by all CI agents to cover runs on different
+machines.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+
+from inlineplz.util import git, system
+
+# seconds between reads of the lease file
+CHECK_INTERVAL = 1
+# minimum seconds between API checks for new commits while we hold a lease
+LEASED_FRESHNESS_INTERVAL = 60
+
+
+def lease_path(directory, *parts):
+    """
+    The lease file for the pull request identified by parts.
+
+    The path is absolute, so the watcher still finds it if we change directories.
+    """
+    key = hashlib.sha1(json.dumps(parts).encode("utf-8")).hexdigest()[:16]
+    return os.path.abspath(os.path.join(directory, key + ".lease"))
+
+
+class Lease(object):
+    def __init__(self, path, sha=None):
+        """Lease at path for a run reviewing sha."""
+        self.path = path
+        self.sha = sha
+        self.run_id = uuid.uuid4().hex
+        self.holder = None
+        self.last_check = None
+        self.lock = threading.Lock()
+
+    def read(self):
+        try:
+            with open(self.path) as lease_file:
+                return json.load(lease_file)
+
+        except (IOError, OSError, ValueError):
+            return None
+
+    def acquire(self):
+        """
+        Take the lease over from older runs.
+
+        Returns False without taking it if the current holder reviews a newer commit,
+        such as when an old build is retried after a newer one started.
+        """
+        holder = self.read()
+        if (
+            holder
+            and self.sha
+            and holder.get("sha") not in (None, self.sha)
+            and git.is_ancestor(self.sha, holder["sha"])
+        ):
+            self.holder = holder
+            return False
+
+        handle, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path))
+        with os.fdopen(handle, "w") as lease_file:
+            json.dump(
+                {
+                    "run": self.run_id,
+                    "sha": self.sha,
+                    "host": socket.gethostname(),
+                    "pid": os.getpid(),
+                    "started": time.time(),
+                },
+                lease_file,
+            )
+        os.replace(tmp_path, self.path)
+        return True
+
+    def superseded(self):
+        """Check if another run took the lease, reading it at most every CHECK_INTERVAL."""
+        with self.lock:
+            if self.holder:
+                return True
+
+            now = time.time()
+            if self.last_check is not None and now - self.last_check < CHECK_INTERVAL:
+                return False
+
+            self.last_check = now
+            holder = self.read()
+            # a missing lease was cleaned up by hand, keep going
+            if holder and holder.get("run") != self.run_id:
+                print(
+                    "Superseded by a newer run for {0} on {1}".format(
+                        holder.get("sha"), holder.get("host")
+                    )
+                )
+                self.holder = holder
+            return bool(self.holder)
+
+    def release(self):
+        """Remove the lease file, unless a newer run holds it now."""
+        holder = self.read()
+        if holder and holder.get("run") == self.run_id:
+            try:
+                os.remove(self.path)
+            except OSError:
+                traceback.print_exc()
+
+
+class LeaseWatcher(threading.Thread):
+    def __init__(self, lease):
+        """
+        Stop this run as soon as its lease is superseded.
+
+        should_stop() starts returning True, so linting and posting wind down, and
+        running linter subprocesses are killed. Call stop() when the run is done.
+        """
+        super(LeaseWatcher, self).__init__()
+        self.daemon = True
+        self.lease = lease
+        self.done = threading.Event()
+
+    def start(self):
+        system.add_stop_check(self.lease.superseded)
+        super(LeaseWatcher, self).start()
+
+    def run(self):
+        while not self.done.wait(CHECK_INTERVAL):
+            if self.lease.superseded():
+                system.stop_processes()
+                return
+
+    def stop(self):
+        self.done.set()
+        system.remove_stop_check(self.lease.superseded)
+        self.lease.release()
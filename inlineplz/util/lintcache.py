@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+"""
+Remember each linter's parsed messages for a given set of inputs.
+
+Retried and re-triggered builds lint identical trees, so when a linter's command, config
+files, version and input files all match an earlier run we can reuse its messages
+instead of running it again.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import hashlib
+import json
+
+from inlineplz.util import system
+from inlineplz.util.httpcache import DiskCache
+
+MAX_ENTRIES = 200
+
+
+def make_key(*parts):
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class LintCache(DiskCache):
+    def __init__(self, path=None, max_entries=MAX_ENTRIES):
+        """DiskCache of linter messages that evicts the least recently used entries."""
+        super(LintCache, self).__init__(
+            path or system.cache_dir("lint"), max_entries=max_entries
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = super(LintCache, self).get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def report(self):
+        print(
+            "Lint cache: {} of {} linters reused earlier results.".format(
+                self.hits, self.hits + self.misses
+            )
+        )
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+"""
+Adaptive pacing for GitHub API writes, driven by the rate limit headers on every response.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import random
+import threading
+import time
+
+RATE_LIMITED_STATUSES = (403, 429)
+
+
+def header_int(headers, name):
+    try:
+        return int(headers.get(name))
+
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestScheduler(object):
+    def __init__(
+        self,
+        min_interval=0.1,
+        low_water=100,
+        base_backoff=1,
+        max_backoff=300,
+        token_pool=None,
+    ):
+        """
+        Decide how long to wait before the next API write.
+
+        While more than low_water requests remain in the current rate limit window we only
+        keep min_interval seconds between requests. Below that, the remaining budget is
+        spread evenly over the time left until the window resets.
+
+        With a token_pool, the budget is what's left across all of its tokens rather than
+        what the last response said.
+        """
+        self.min_interval = min_interval
+        self.low_water = low_water
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.remaining = None
+        self.reset = None
+        self.retry_after = None
+        self.next_request = 0
+        self.token_pool = token_pool
+        self.lock = threading.Lock()
+
+    def update(self, response, *args, **kwargs):
+        """requests response hook that records rate limit headers."""
+        headers = response.headers
+        with self.lock:
+            remaining = header_int(headers, "X-RateLimit-Remaining")
+            if remaining is not None:
+                self.remaining = remaining
+                self.reset = header_int(headers, "X-RateLimit-Reset")
+            if response.status_code in RATE_LIMITED_STATUSES:
+                self.retry_after = header_int(headers, "Retry-After")
+        return response
+
+    def budget(self):
+        """Return the requests remaining and when the rate limit window resets."""
+        if self.token_pool:
+            return self.token_pool.budget()
+
+        return self.remaining, self.reset
+
+    def delay(self):
+        remaining, reset = self.budget()
+        if remaining is None or remaining > self.low_water:
+            return self.min_interval
+
+        window = max((reset or time.time()) - time.time(), 0)
+        return max(self.min_interval, window / max(remaining, 1))
+
+    def wait(self):
+        """Block until it's our turn to send the next request."""
+        with self.lock:
+            now = time.time()
+            start = max(now, self.next_request)
+            self.next_request = start + self.delay()
+        if start > now:
+            time.sleep(start - now)
+
+    def is_rate_limited(self, error):
+        """Check whether a GitHubError was caused by a primary or secondary rate limit."""
+        if getattr(error, "code", None) not in RATE_LIMITED_STATUSES:
+            return False
+
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        return (
+            error.code == 429
+            or "Retry-After" in headers
+            or header_int(headers, "X-RateLimit-Remaining") == 0
+            or "rate limit" in (getattr(error, "msg", None) or "").lower()
+        )
+
+    def backoff(self, attempt):
+        """Sleep after a rate limited request, honoring Retry-After when GitHub sends it."""
+        remaining, reset = self.budget()
+        with self.lock:
+            retry_after, self.retry_after = self.retry_after, None
+            if retry_after is None and remaining == 0 and reset:
+                retry_after = reset - time.time()
+        if retry_after is None:
+            retry_after = min(self.max_backoff, self.base_backoff * 2 ** attempt)
+        # jitter so concurrent runs don't retry in lockstep
+        retry_after = min(max(retry_after, 0), self.max_backoff) * (
+            1 + random.random() / 2
+        )
+        print("Rate limited, retrying in {:.1f} seconds.".format(retry_after))
+        time.sleep(retry_after)
+        with self.lock:
+            self.next_request = max(self.next_request, time.time())
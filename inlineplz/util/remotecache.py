@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+"""
+Share lint results between machines through a cache server.
+
+Ephemeral CI containers start with an empty local cache, so entries are also stored on a
+server that answers GET and PUT of /<key>, like build tools' remote caches. See
+inlineplz.cacheserver for a reference server.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import threading
+
+import requests
+
+REMOTE_CACHE_ENV = "INLINEPLZ_REMOTE_CACHE"
+DEFAULT_TIMEOUT = 5
+
+
+class RemoteCache(object):
+    def __init__(self, url, local=None, timeout=DEFAULT_TIMEOUT, session=None):
+        """
+        Cache that checks local first, then the server at url, and stores to both.
+
+        The server is only an optimization: after a connection error or timeout we stop
+        talking to it for the rest of the run and fall back to the local cache alone.
+        """
+        self.url = url.rstrip("/")
+        self.local = local
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.lock = threading.Lock()
+        self.available = True
+        self.local_hits = 0
+        self.remote_hits = 0
+        self.misses = 0
+        self.bytes_down = 0
+        self.bytes_up = 0
+
+    def _url(self, key):
+        return "{0}/{1}".format(self.url, key)
+
+    def _failed(self, action, error):
+        print(
+            "Remote cache {0} failed, using the local cache only: {1}".format(
+                action, error
+            )
+        )
+        with self.lock:
+            self.available = False
+
+    def get(self, key):
+        entry = self.local.get(key) if self.local else None
+        if entry is not None:
+            with self.lock:
+                self.local_hits += 1
+            return entry
+
+        if self.available:
+            try:
+                response = self.session.get(self._url(key), timeout=self.timeout)
+                if response.status_code == 200:
+                    entry = json.loads(response.content.decode("utf-8"))
+                    with self.lock:
+                        self.remote_hits += 1
+                        self.bytes_down += len(response.content)
+                    if self.local:
+                        self.local.set(key, entry)
+                    return entry
+
+                if response.status_code != 404:
+                    print("Remote cache GET returned {0}".format(response.status_code))
+            except (requests.RequestException, ValueError) as error:
+                self._failed("GET", error)
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, entry):
+        if self.local:
+            self.local.set(key, entry)
+        if not self.available:
+            return
+
+        data = json.dumps(entry, sort_keys=True).encode("utf-8")
+        try:
+            response = self.session.put(
+                self._url(key),
+                data=data,
+                headers={"Content-Type": "application/json"},
+                timeout=self.timeout,
+            )
+            if response.status_code not in (200, 201, 204):
+                print("Remote cache PUT returned {0}".format(response.status_code))
+                return
+
+            with self.lock:
+                self.bytes_up += len(data)
+        except requests.RequestException as error:
+            self._failed("PUT", error)
+
+    def report(self):
+        lookups = self.local_hits + self.remote_hits + self.misses
+        print(
+            "Remote cache: {} of {} lookups hit ({} local, {} remote), "
+            "{} bytes downloaded, {} bytes uploaded.".format(
+                self.local_hits + self.remote_hits,
+                lookups,
+                self.local_hits,
+                self.remote_hits,
+                self.bytes_down,
+                self.bytes_up,
+            )
+        )
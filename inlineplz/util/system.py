@@ -10,11 +10,85 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 
+import contextlib
 import os
+import threading
 
 
 STOP_FILE_NAME = ".inlineplzstop"
+CACHE_DIR_ENV = "INLINEPLZ_CACHE_DIR"
+# resolved once, so linting in another directory (like a baseline worktree) still sees it
+STOP_FILE = os.path.abspath(STOP_FILE_NAME)
+
+# extra reasons to stop, such as a newer run taking over, see add_stop_check
+_stop_checks = []
+# subprocesses to kill when we stop, see track_process
+_processes = set()
+_processes_lock = threading.Lock()
+_stopping = threading.Event()
 
 
 def should_stop():
-    return os.path.isfile(os.path.join(os.getcwd(), STOP_FILE_NAME))
+    return os.path.isfile(STOP_FILE) or any(check() for check in list(_stop_checks))
+
+
+def add_stop_check(check):
+    """Make should_stop() also return True once check() does."""
+    _stop_checks.append(check)
+
+
+def remove_stop_check(check):
+    if check in _stop_checks:
+        _stop_checks.remove(check)
+
+
+@contextlib.contextmanager
+def track_process(proc):
+    """Register a running subprocess so stop_processes() can kill it."""
+    with _processes_lock:
+        _processes.add(proc)
+    if _stopping.is_set():
+        proc.kill()
+    try:
+        yield proc
+    finally:
+        with _processes_lock:
+            _processes.discard(proc)
+
+
+def stop_processes():
+    """Kill every tracked subprocess, and any started from now on."""
+    _stopping.set()
+    with _processes_lock:
+        processes = list(_processes)
+    for proc in processes:
+        try:
+            proc.kill()
+        except OSError:
+            pass
+
+
+def cache_dir(*parts):
+    """Return (and create) a directory under inline-plz's persistent cache root."""
+    root = os.environ.get(CACHE_DIR_ENV) or os.path.join(
+        os.path.expanduser("~"), ".cache", "inlineplz"
+    )
+    path = os.path.join(root, *parts)
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+    return path
+
+
+def directory_size(path):
+    """Total size in bytes of the files under path."""
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return size
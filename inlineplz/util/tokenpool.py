@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+"""
+Spread GitHub API requests over several tokens.
+
+Each token has its own hourly rate limit, so we track every token's remaining quota from
+response headers and send each request with the token that has the most left.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import re
+import threading
+import time
+
+from requests.auth import AuthBase
+
+from inlineplz.util.ratelimit import header_int
+
+TOKENS_ENV = "INLINEPLZ_GITHUB_TOKENS"
+# how long to wait when every token is out of quota but GitHub didn't say until when
+DEFAULT_RESET_WAIT = 60
+
+
+def load_tokens(token=None, path=None):
+    """
+    Collect tokens from token, the INLINEPLZ_GITHUB_TOKENS envvar and a file at path.
+
+    Tokens can be separated by commas or whitespace. Lines in the file starting with #
+    are ignored.
+    """
+    sources = [token or "", os.environ.get(TOKENS_ENV, "")]
+    if path:
+        with open(path) as tokens_file:
+            sources.extend(
+                line for line in tokens_file if not line.strip().startswith("#")
+            )
+    tokens = []
+    for source in sources:
+        for item in re.split(r"[\s,]+", source):
+            if item and item not in tokens:
+                tokens.append(item)
+    return tokens
+
+
+class TokenState(object):
+    def __init__(self, token):
+        self.token = token
+        # None until we've seen a response for this token
+        self.remaining = None
+        self.reset = None
+
+
+def quota(state):
+    # try tokens we know nothing about before ones we know are in use
+    if state.remaining is None:
+        return float("inf")
+
+    return state.remaining
+
+
+class TokenPool(object):
+    def __init__(self, tokens):
+        self.states = [TokenState(token) for token in tokens]
+        self.lock = threading.Lock()
+
+    def _expire(self, now):
+        for state in self.states:
+            if state.reset and state.reset <= now:
+                state.remaining = None
+                state.reset = None
+
+    def acquire(self):
+        """Return the token with the most quota left, waiting if they're all used up."""
+        while True:
+            with self.lock:
+                now = time.time()
+                self._expire(now)
+                available = [
+                    state
+                    for state in self.states
+                    if state.remaining is None or state.remaining > 0
+                ]
+                if available:
+                    state = max(available, key=quota)
+                    if state.remaining is not None:
+                        # count it now so concurrent requests spread out
+                        state.remaining -= 1
+                    return state.token
+
+                resets = [state.reset for state in self.states if state.reset]
+                wait = min(resets) - now if resets else DEFAULT_RESET_WAIT
+            print(
+                "All {0} tokens are rate limited, waiting {1:.0f} seconds.".format(
+                    len(self.states), wait
+                )
+            )
+            time.sleep(max(wait, 0) + 1)
+
+    def update(self, token, response):
+        """Record the rate limit headers of a response sent with token."""
+        remaining = header_int(response.headers, "X-RateLimit-Remaining")
+        if remaining is None:
+            return
+
+        with self.lock:
+            for state in self.states:
+                if state.token == token:
+                    state.remaining = remaining
+                    state.reset = header_int(response.headers, "X-RateLimit-Reset")
+
+    def budget(self):
+        """
+        Return the quota left across all tokens and the earliest reset.
+
+        Remaining is None while some token hasn't been used yet.
+        """
+        with self.lock:
+            self._expire(time.time())
+            if any(state.remaining is None for state in self.states):
+                return None, None
+
+            resets = [state.reset for state in self.states if state.reset]
+            return (
+                sum(state.remaining for state in self.states),
+                min(resets) if resets else None,
+            )
+
+
+class TokenPoolAuth(AuthBase):
+    def __init__(self, pool):
+        """requests auth that signs each request with a token from pool."""
+        self.pool = pool
+
+    def __call__(self, request):
+        token = self.pool.acquire()
+        request.headers["Authorization"] = "token {0}".format(token)
+
+        def record(response, *args, **kwargs):
+            self.pool.update(token, response)
+            return response
+
+        request.register_hook("response", record)
+        return request
@@ -10,7 +10,6 @@ with open("HISTORY.rst") as history_file:
     history = history_file.read()
 
 requirements = [
-    "unidiff",
     "github3.py",
     "xmltodict",
     "pyyaml",
@@ -52,5 +51,10 @@ setup(
     ],
     test_suite="tests",
     tests_require=test_requirements,
-    entry_points={"console_scripts": ["inline-plz = inlineplz.main:main"]},
+    entry_points={
+        "console_scripts": [
+            "inline-plz = inlineplz.main:main",
+            "inline-plz-cache-server = inlineplz.cacheserver:main",
+        ]
+    },
 )
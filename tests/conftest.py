@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import subprocess
+import threading
+from http.server import HTTPServer
+
+import pytest
+
+from inlineplz.util import git
+
+
+class FakeArgs(object):
+    config_dir = None
+    enabled_linters = None
+    disabled_linters = None
+    ignore_paths = ["node_modules"]
+    autorun = True
+
+
+@pytest.fixture
+def lint_args():
+    """The linting options that cache keys depend on."""
+    return FakeArgs()
+
+
+@pytest.fixture
+def git_repo(tmpdir):
+    """A new git repo in tmpdir, which is the working directory during the test."""
+    with tmpdir.as_cwd():
+        subprocess.check_call(["git", "init", "-q"])
+        yield tmpdir
+
+
+@pytest.fixture
+def commit(git_repo):
+    """Write content to path in git_repo and commit it, returning the new sha."""
+
+    def commit(path, content):
+        git_repo.join(path).write(content)
+        subprocess.check_call(["git", "add", path])
+        subprocess.check_call(
+            ["git", "-c", "user.name=a", "-c", "user.email=a@b", "commit", "-qm", "c"]
+        )
+        return git.current_sha()
+
+    return commit
+
+
+@pytest.fixture
+def serve():
+    """Serve a request handler class on localhost, returning the base URL."""
+    servers = []
+
+    def serve(handler):
+        # keep request logging out of the test output
+        quiet = type(
+            str("Quiet" + handler.__name__),
+            (handler,),
+            {"log_message": lambda self, *args: None},
+        )
+        server = HTTPServer(("127.0.0.1", 0), quiet)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        servers.append(server)
+        return "http://127.0.0.1:{}".format(server.server_port)
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import json as jsonlib
+import threading
+import time
+
+from inlineplz import message
+from inlineplz.interfaces import github
+from inlineplz.util import ratelimit
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self.data = data
+        self.headers = {}
+        self.content = b""
+
+    def json(self):
+        return self.data
+
+
+class FakeHead(object):
+    def __init__(self, ref, sha):
+        self.ref = ref
+        self.sha = sha
+
+
+class FakePull(object):
+    def __init__(self, number, ref, sha):
+        self.number = number
+        self.head = FakeHead(ref, sha)
+
+
+class FakeOwner(object):
+    login = "owner"
+
+
+class FakeRepo(object):
+    owner = FakeOwner()
+    _api = "https://api.github.com/repos/owner/repo"
+    full_name = "owner/repo"
+    parent = None
+
+    def __init__(self, pulls=()):
+        self.pulls = list(pulls)
+        self.requests = []
+
+    def pull_requests(self, state=None, head=None, number=-1):
+        self.requests.append(head)
+        if head:
+            owner, branch = head.split(":")
+            return [pull for pull in self.pulls if pull.head.ref == branch][:number]
+        return self.pulls
+
+    def _build_url(self, *args, **kwargs):
+        return "/".join((kwargs["base_url"],) + args)
+
+    def _post(self, url, data=None, json=True):
+        # like github3, encode data unless told it's already encoded
+        body = jsonlib.dumps(data) if json else data
+        self.requests.append(("POST", url, jsonlib.loads(body)))
+        return FakeResponse(201, {"url": url + "/1"})
+
+    def _patch(self, url, data=None):
+        self.requests.append(("PATCH", url, jsonlib.loads(data)))
+        return FakeResponse(200, {"url": url})
+
+    def _json(self, response, expected_status):
+        assert response.status_code == expected_status
+        return response.data
+
+
+class FakeDiffIndex(object):
+    def position(self, path, line_number):
+        return line_number
+
+
+def make_interface(pull_request=None, interface_class=github.GitHubInterface):
+    """An interface_class for pull_request that talks to fakes instead of GitHub."""
+    interface = interface_class.__new__(interface_class)
+    interface.prefix = "[inline-plz]"
+    interface.last_sha = "abc123"
+    interface.pull_request = pull_request
+    interface.messages_in_files = dict()
+    interface.formatted_messages = dict()
+    interface.review_comments = github.ReviewCommentStore(pull_request)
+    interface.scheduler = ratelimit.RequestScheduler(min_interval=0, base_backoff=0)
+    interface.github = True
+    interface.github_repo = FakeRepo()
+    interface.diff_index = FakeDiffIndex()
+    interface.ignore_paths = set()
+    interface.batch_review = False
+    interface.stopped_early = False
+    interface.post_concurrency = 1
+    interface.pool = None
+    interface.http_cache = None
+    interface.check_run_url = None
+    interface.posted_bodies = dict()
+    interface.lock = threading.Lock()
+    interface.freshness = github.FreshnessChecker(None, None, "abc123", 60, "abc123")
+    interface.freshness.last_check = time.time()
+    return interface
+
+
+def make_messages(count, comment="pylint: line too long"):
+    """One message with comment on each of the first count lines of app.py."""
+    messages = []
+    for line in range(1, count + 1):
+        msg = message.Message("app.py", line)
+        msg.append(comment)
+        messages.append(msg)
+    return messages
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+from inlineplz.interfaces import checks
+
+from .conftest import make_interface
+from .conftest import make_messages
+
+
+def test_annotations_are_batched():
+    interface = make_interface(interface_class=checks.ChecksInterface)
+    interface.start_review()
+    assert interface.post_messages(make_messages(120), 25) == 120
+    interface.finish_review(success=False)
+
+    requests = interface.github_repo.requests
+    assert requests[0][0] == "POST"
+    assert requests[0][2]["status"] == "in_progress"
+    annotation_batches = [
+        len(data["output"]["annotations"])
+        for _, _, data in requests
+        if "annotations" in data.get("output", {})
+    ]
+    assert annotation_batches == [50, 50, 20]
+    assert all(url.endswith("/check-runs/1") for _, url, _ in requests[1:])
+    assert requests[-1][2]["conclusion"] == "failure"
+    assert "120 messages" in requests[-1][2]["output"]["summary"]
+
+
+def test_later_linters_only_annotate_new_comments():
+    interface = make_interface(interface_class=checks.ChecksInterface)
+    interface.start_review()
+    interface.begin_posting(25)
+    interface.queue_messages(make_messages(2))
+    updated = make_messages(1)[0]
+    updated.append("flake8: E501 line too long")
+    interface.queue_messages([updated])
+    assert interface.end_posting() == 2
+
+    annotations = interface.github_repo.requests[-1][2]["output"]["annotations"]
+    assert [annotation["message"] for annotation in annotations] == [
+        "pylint: line too long",
+        "pylint: line too long",
+        "flake8: E501 line too long",
+    ]
@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import datetime
+import time
+
+import github3
+import pytest
+import requests
+
+from inlineplz import message
+from inlineplz.interfaces import github
+
+from .conftest import FakePull
+from .conftest import FakeRepo
+from .conftest import FakeResponse
+from .conftest import make_interface
+from .conftest import make_messages
+
+
+def review_messages(count):
+    """Long messages paired with their diff positions, as submit_review takes them."""
+    messages = make_messages(count, "pylint: line too long " + "x" * 100)
+    return [(msg, msg.line_number) for msg in messages]
+
+
+class FakePullRequest(object):
+    def __init__(self, reject_reviews=False, bad_positions=(), rate_limited=()):
+        self.reject_reviews = reject_reviews
+        self.bad_positions = set(bad_positions)
+        self.rate_limited = set(rate_limited)
+        self.reviews = []
+        self.comments = []
+
+    def review_comments(self):
+        return []
+
+    def create_review(self, body, commit_id=None, event=None, comments=None):
+        if self.reject_reviews:
+            raise github3.GitHubError(FakeResponse(422))
+        self.reviews.append(comments)
+
+    def create_review_comment(self, body, commit_id, path, position):
+        if position in self.bad_positions:
+            raise github3.GitHubError(FakeResponse(422))
+        if position in self.rate_limited:
+            self.rate_limited.remove(position)
+            raise github3.GitHubError(FakeResponse(429))
+        self.comments.append((path, position))
+        return FakeComment(len(self.comments), path, position, body, 0)
+
+
+def test_review_batches_split_by_size(monkeypatch):
+    monkeypatch.setattr(github, "REVIEW_BATCH_BYTES", 1000)
+    interface = make_interface(FakePullRequest())
+    batches = list(interface.review_batches(review_messages(20)))
+    assert len(batches) > 1
+    assert sum(len(batch) for batch in batches) == 20
+
+
+def test_submit_review():
+    pull_request = FakePullRequest()
+    interface = make_interface(pull_request)
+    assert interface.submit_review(review_messages(5)) == 0
+    assert len(pull_request.reviews) == 1
+    assert len(pull_request.reviews[0]) == 5
+    assert len(interface.messages_in_files["app.py"]) == 5
+
+
+def test_submit_review_falls_back_to_single_comments():
+    pull_request = FakePullRequest(reject_reviews=True, bad_positions=[2])
+    interface = make_interface(pull_request)
+    assert interface.submit_review(review_messages(3)) == 1
+    assert pull_request.comments == [("app.py", 1), ("app.py", 3)]
+    assert len(interface.messages_in_files["app.py"]) == 2
+
+
+def test_submit_review_stops_when_out_of_date(monkeypatch):
+    monkeypatch.setattr(github, "REVIEW_BATCH_BYTES", 1000)
+    pull_request = FakePullRequest()
+    interface = make_interface(pull_request)
+    interface.out_of_date = lambda: len(pull_request.reviews) > 0
+    assert interface.submit_review(review_messages(20)) > 0
+    assert len(pull_request.reviews) == 1
+    assert interface.stopped_early
+
+
+def test_end_posting_drops_pending_reviews_after_stopping_early():
+    pull_request = FakePullRequest()
+    interface = make_interface(pull_request)
+    interface.batch_review = True
+    interface.begin_posting(0)
+    interface.queue_messages(make_messages(3))
+    assert len(interface.pending_comments) == 3
+    interface.out_of_date = lambda: True
+    interface.queue_messages(make_messages(5)[3:])
+    assert interface.stopped_early
+    assert interface.end_posting() == 0
+    assert pull_request.reviews == []
+    assert pull_request.comments == []
+
+
+class FakeSession(object):
+    def __init__(self, head_sha):
+        self.head_sha = head_sha
+        self.requests = []
+
+    def get(self, url, headers=None):
+        self.requests.append(headers)
+        if headers.get("If-None-Match") == '"etag-' + self.head_sha + '"':
+            return FakeResponse(304)
+        response = FakeResponse(200)
+        response.headers["ETag"] = '"etag-' + self.head_sha + '"'
+        response.json = lambda: {"head": {"sha": self.head_sha}}
+        return response
+
+
+def test_freshness_checker():
+    session = FakeSession("abc123")
+    checker = github.FreshnessChecker(session, "pulls/1", "abc123", 60)
+    assert not checker.out_of_date()
+    assert not checker.out_of_date()
+    # only one request per interval
+    assert len(session.requests) == 1
+    checker.last_check = 0
+    assert not checker.out_of_date()
+    assert session.requests[-1] == {"If-None-Match": '"etag-abc123"'}
+    session.head_sha = "def456"
+    checker.last_check = 0
+    assert checker.out_of_date()
+
+
+class FakeComment(object):
+    def __init__(self, comment_id, path, position, body, updated_at):
+        self.id = comment_id
+        self.path = path
+        self.position = position
+        self.original_position = position
+        self.body = body
+        self.updated_at = datetime.datetime(2018, 1, 1, 0, 0, updated_at)
+        self.edits = 0
+
+    def edit(self, body):
+        self.body = body
+        self.edits += 1
+
+    def delete(self):
+        self.deleted = True
+        return True
+
+
+class FakeCommentPullRequest(object):
+    _api = "https://api.github.com/repos/owner/repo/pulls/1"
+
+    def __init__(self, comments):
+        self.comments = comments
+        self.since = []
+
+    def review_comments(self):
+        return list(self.comments)
+
+    def _build_url(self, *args, **kwargs):
+        return self._api + "/comments"
+
+    def _iter(self, count, url, cls, params=None):
+        self.since.append(params["since"])
+        return [comment for comment in self.comments if comment.updated_at.second >= 2]
+
+
+def test_review_comment_store():
+    pull_request = FakeCommentPullRequest(
+        [
+            FakeComment(1, "app.py", 3, "[inline-plz]: `one`", 1),
+            FakeComment(2, "app.py", 4, "[inline-plz]: `two`\n", 2),
+        ]
+    )
+    store = github.ReviewCommentStore(pull_request)
+    store.refresh()
+    assert store.find("app.py", 4, "[inline-plz]: `two`").id == 2
+    assert store.find("app.py", 3, "[inline-plz]: `two`") is None
+
+    pull_request.comments[1].body = "[inline-plz]: `edited`"
+    store.refresh(force=True)
+    assert pull_request.since == ["2018-01-01T00:00:02Z"]
+    assert store.find("app.py", 4, "[inline-plz]: `two`") is None
+    assert store.find("app.py", 4, "[inline-plz]: `edited`").id == 2
+
+    store.remove(pull_request.comments[0])
+    assert store.find("app.py", 3, "[inline-plz]: `one`") is None
+    assert [comment.id for comment in store] == [2]
+
+
+class GoneComment(FakeComment):
+    def delete(self):
+        raise github3.GitHubError(FakeResponse(404))
+
+
+def test_clear_outdated_messages_skips_deleted_comments():
+    kept = FakeComment(1, "app.py", 3, "[inline-plz]: `one`", 1)
+    removed = FakeComment(2, "app.py", 4, "[inline-plz]: `two`", 2)
+    pull_request = FakeCommentPullRequest([kept, removed])
+    interface = make_interface(pull_request)
+    interface.review_comments.refresh()
+    # deleted by someone else mid-run, which a `since` listing wouldn't tell us
+    pull_request.comments.remove(removed)
+    interface.clear_outdated_messages()
+    assert kept.deleted
+    assert not hasattr(removed, "deleted")
+    assert list(interface.review_comments) == []
+
+
+def test_delete_comment_that_is_already_gone():
+    gone = GoneComment(1, "app.py", 3, "[inline-plz]: `one`", 1)
+    interface = make_interface(FakeCommentPullRequest([gone]))
+    interface.review_comments.refresh()
+    interface.delete_comment(gone)
+    assert list(interface.review_comments) == []
+
+
+def test_find_pull_request(monkeypatch, tmpdir):
+    monkeypatch.setenv("INLINEPLZ_CACHE_DIR", str(tmpdir))
+    repo = FakeRepo([FakePull(7, "other", "aaa"), FakePull(8, "feature", "abc123")])
+    interface = make_interface(None)
+    interface.github_repo = repo
+    assert interface.find_pull_request("feature", "abc123") == (repo, 8)
+    assert repo.requests == ["owner:feature"]
+
+    # cached while the branch still points at the same commit
+    assert interface.find_pull_request("feature", "abc123") == (repo, 8)
+    assert repo.requests == ["owner:feature"]
+
+    assert interface.find_pull_request("feature", "def456") == (repo, 8)
+    assert repo.requests == ["owner:feature", "owner:feature"]
+
+    assert interface.find_pull_request("missing", "abc123") == (repo, None)
+    assert repo.requests[-2:] == ["owner:missing", None]
+
+
+def test_post_messages_concurrently():
+    pull_request = FakePullRequest(bad_positions=[3], rate_limited=[5])
+    interface = make_interface(pull_request)
+    interface.post_concurrency = 4
+    messages = make_messages(10)
+    assert interface.post_messages(messages, 0) == 9
+    assert sorted(position for _, position in pull_request.comments) == [
+        1,
+        2,
+        4,
+        5,
+        6,
+        7,
+        8,
+        9,
+        10,
+    ]
+
+
+def test_post_messages_respects_max_comments():
+    pull_request = FakePullRequest()
+    interface = make_interface(pull_request)
+    interface.post_concurrency = 4
+    messages = make_messages(10)
+    assert interface.post_messages(messages, 4) == 5
+    assert len(pull_request.comments) == 5
+
+
+def test_queue_messages_edits_comments_from_later_linters():
+    pull_request = FakePullRequest()
+    interface = make_interface(pull_request)
+    interface.begin_posting(2)
+    first = make_messages(2)
+    interface.queue_messages(first)
+    later = first[0].copy()
+    later.append("flake8: E501 line too long")
+    extra = message.Message("other.py", 1)
+    extra.append("flake8: F401 unused import")
+    interface.queue_messages([later, extra])
+    assert interface.end_posting() == 3
+    assert len(pull_request.comments) == 3
+    posted = interface.posted_comment(later, 1)
+    assert posted.edits == 1
+    assert "flake8" in posted.body
+
+
+class FakeStatus(object):
+    def __init__(self, context, description):
+        self.context = context
+        self.description = description
+
+
+class FakeCommit(object):
+    def __init__(self, sha):
+        self.sha = sha
+
+
+class FakeStatusRepo(object):
+    def __init__(self, statuses):
+        self.statuses_by_sha = statuses
+
+    def statuses(self, sha):
+        return self.statuses_by_sha.get(sha, [])
+
+
+class FakeCommitsPullRequest(object):
+    def __init__(self, shas):
+        self.shas = shas
+
+    def commits(self):
+        return [FakeCommit(sha) for sha in self.shas]
+
+
+class FakeOldCommitsPullRequest(object):
+    # github.py == 0.9.6
+    def __init__(self, shas):
+        self.shas = shas
+
+    def iter_commits(self):
+        return iter([FakeCommit(sha) for sha in self.shas])
+
+
+def test_pr_commits():
+    for pull_request in [
+        FakeCommitsPullRequest(["a", "b"]),
+        FakeOldCommitsPullRequest(["a", "b"]),
+    ]:
+        commits = github.GitHubInterface.pr_commits(pull_request)
+        assert [commit.sha for commit in commits] == ["a", "b"]
+
+
+class FakeOldStatusRepo(object):
+    # github.py == 0.9.6
+    def __init__(self, statuses):
+        self.statuses_by_sha = statuses
+
+    def iter_statuses(self, sha):
+        return iter(self.statuses_by_sha.get(sha, []))
+
+
+def test_reviewed_shas_with_old_github3():
+    interface = make_interface(FakeOldCommitsPullRequest(["a", "b"]))
+    interface.github_repo = FakeOldStatusRepo(
+        {"a": [FakeStatus("inline-plz", "Static analysis complete! No errors.")]}
+    )
+    assert list(interface.reviewed_shas()) == ["a"]
+
+
+def test_reviewed_shas():
+    interface = make_interface(FakeCommitsPullRequest(["a", "b", "c", "d"]))
+    interface.github_repo = FakeStatusRepo(
+        {
+            "a": [FakeStatus("inline-plz", "Static analysis complete! No errors.")],
+            "b": [
+                FakeStatus("other", "Build complete!"),
+                FakeStatus("inline-plz", "Static analysis complete! Found errors."),
+            ],
+            # stopped early after an earlier complete run
+            "c": [
+                FakeStatus("inline-plz", "Static analysis stopped early!"),
+                FakeStatus("inline-plz", "Static analysis complete! Found errors."),
+            ],
+            "d": [FakeStatus("inline-plz", "Static analysis in progress.")],
+        }
+    )
+    assert list(interface.reviewed_shas()) == ["b", "a"]
+
+
+class RepositoryLookup(Exception):
+    pass
+
+
+class FakeGitHub(object):
+    tokens = []
+
+    def __init__(self, token=None):
+        self.tokens.append(token)
+        self.session = requests.Session()
+
+    def repository(self, owner, repo):
+        raise RepositoryLookup(owner, repo)
+
+
+def test_single_pooled_token_is_used(monkeypatch):
+    monkeypatch.setattr(github.github3, "GitHub", FakeGitHub)
+    with pytest.raises(RepositoryLookup):
+        github.GitHubInterface("owner", "repo", pr=1, http_cache=False, tokens=["only"])
+    assert FakeGitHub.tokens == ["only"]
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import pytest
+
+from inlineplz.interfaces import github
+from inlineplz.interfaces import github_graphql
+
+from .conftest import FakeResponse
+
+
+def comment_node(comment_id, position, updated_at):
+    return {
+        "databaseId": comment_id,
+        "path": "app.py",
+        "position": position,
+        "originalPosition": position,
+        "body": "[inline-plz]: `comment {0}`".format(comment_id),
+        "updatedAt": "2018-01-01T00:00:{0:02d}Z".format(updated_at),
+    }
+
+
+def page(comments, cursor=None, more_comments=False):
+    return {
+        "data": {
+            "repository": {
+                "pullRequest": {
+                    "headRefOid": "head",
+                    "baseRefOid": "base",
+                    "baseRefName": "master",
+                    "baseRepository": {
+                        "url": "https://github.com/owner/repo",
+                        "sshUrl": "git@github.com:owner/repo.git",
+                        "owner": {"login": "owner"},
+                    },
+                    "reviewThreads": {
+                        "pageInfo": {
+                            "hasNextPage": cursor is not None,
+                            "endCursor": cursor,
+                        },
+                        "nodes": [
+                            {
+                                "comments": {
+                                    "pageInfo": {"hasNextPage": more_comments},
+                                    "nodes": comments,
+                                }
+                            }
+                        ],
+                    },
+                }
+            }
+        }
+    }
+
+
+class FakeSession(object):
+    base_url = "https://ghe.example.com/api/v3"
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.queries = []
+        self.patches = []
+
+    def post(self, url, json=None):
+        self.queries.append((url, json["variables"]["threads"]))
+        return FakeResponse(200, self.pages.pop(0))
+
+    def patch(self, url, json=None):
+        self.patches.append((url, json))
+        return FakeResponse(200)
+
+
+def test_graphql_url():
+    assert (
+        github_graphql.graphql_url("https://api.github.com")
+        == "https://api.github.com/graphql"
+    )
+    assert (
+        github_graphql.graphql_url("https://ghe.example.com/api/v3")
+        == "https://ghe.example.com/api/graphql"
+    )
+
+
+def test_load_pull_request():
+    session = FakeSession(
+        [
+            page([comment_node(1, 3, 1), comment_node(2, 4, 5)], cursor="next"),
+            page([comment_node(3, None, 2)]),
+        ]
+    )
+    data = github_graphql.load_pull_request(session, "owner", "repo", "7")
+    assert session.queries == [
+        ("https://ghe.example.com/api/graphql", None),
+        ("https://ghe.example.com/api/graphql", "next"),
+    ]
+    assert data.base_sha == "base"
+    assert data.head_sha == "head"
+    assert data.base_label == "owner:master"
+    assert data.clone_url == "https://github.com/owner/repo.git"
+    assert [comment.id for comment in data.review_comments] == [1, 2, 3]
+
+    store = github.ReviewCommentStore(None)
+    store.load(data.review_comments)
+    assert store.since.second == 5
+    comment = store.find("app.py", 4, "[inline-plz]: `comment 2`")
+    assert comment.edit("[inline-plz]: `edited`")
+    assert session.patches == [
+        (
+            "https://ghe.example.com/api/v3/repos/owner/repo/pulls/comments/2",
+            {"body": "[inline-plz]: `edited`"},
+        )
+    ]
+
+
+def test_long_threads_fall_back_to_rest():
+    session = FakeSession(
+        [page([comment_node(1, 3, 1)], cursor="next", more_comments=True)]
+    )
+    data = github_graphql.load_pull_request(session, "owner", "repo", 7)
+    assert len(session.queries) == 1
+    assert data.head_sha == "head"
+    assert data.review_comments is None
+
+
+def test_load_pull_request_errors():
+    session = FakeSession([{"errors": [{"message": "Bad credentials"}]}])
+    with pytest.raises(github_graphql.GraphQLError, match="Bad credentials"):
+        github_graphql.load_pull_request(session, "owner", "repo", 7)
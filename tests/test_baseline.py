@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import io
+import os
+import shutil
+import sys
+
+from inlineplz import baseline
+from inlineplz import linters
+from inlineplz import message
+from inlineplz.util import diff
+from inlineplz.util import git
+from inlineplz.util import lintcache
+
+
+def lint(failures=None):
+    messages = message.Messages()
+    with io.open("a.py") as source:
+        for line_number, line in enumerate(source, 1):
+            if "bad" in line:
+                messages.add_message("a.py", line_number, "lint: " + line.strip())
+    return messages.get_messages()
+
+
+def test_only_new_messages(monkeypatch, git_repo, commit, lint_args):
+    monkeypatch.setattr(linters, "linter_version", lambda *args: {"version": "1.0"})
+    base_sha = commit("a.py", "ok\nbad one\nok\n")
+    head_sha = commit("a.py", "new\nok\nbad one\nok\nbad two\n")
+    index = diff.DiffIndex(git.diff_lines(base_sha, head_sha))
+    cache = lintcache.LintCache(str(git_repo.mkdir("cache")))
+    calls = []
+
+    def lint_base(failures):
+        calls.append(git.current_sha())
+        return lint()
+
+    key = baseline.cache_key(base_sha, lint_args)
+    base = baseline.load(base_sha, index, cache, key, lint_base)
+    assert calls == [base_sha]
+    new = base.new_messages(lint())
+    assert [(msg.path, msg.line_number, msg.comments) for msg in new] == [
+        ("a.py", 5, {"lint: bad two"})
+    ]
+    assert base.changed_files() == {"a.py"}
+
+    # other PRs on the same base reuse the results
+    baseline.load(base_sha, index, cache, key, lint_base)
+    assert len(calls) == 1
+
+
+def test_base_installs_dont_skip_head_installs(monkeypatch, git_repo, commit):
+    monkeypatch.setattr(linters, "PREVIOUS_INSTALL_COMMANDS", [])
+    marker = os.path.join("node_modules", "fakelint")
+    config = {
+        "install": [
+            [
+                sys.executable,
+                "-c",
+                "import os; os.makedirs('node_modules'); open({!r}, 'w')".format(
+                    marker
+                ),
+            ]
+        ],
+        "help": [sys.executable, "-c", "open({!r})".format(marker)],
+    }
+
+    def lint_installed(failures=None):
+        linters.install_linter(config)
+        found = linters.installed(config)
+        linters.cleanup()
+        return lint() if found else []
+
+    base_sha = commit("a.py", "bad one\n")
+    commit("a.py", "bad one\nbad two\n")
+    assert baseline.lint_commit(base_sha, lint_installed) == [
+        ["a.py", 1, "lint: bad one"]
+    ]
+    assert not os.path.exists("node_modules")
+    assert len(lint_installed()) == 2
+
+
+def test_shifted_messages_with_line_numbers(git_repo, commit):
+    base_sha = commit("a.py", "ok\n" * 11 + "bad (120/100)\n")
+    head_sha = commit("a.py", "new\n" * 3 + "ok\n" * 11 + "bad (120/100)\n")
+    index = diff.DiffIndex(git.diff_lines(base_sha, head_sha))
+    base = baseline.Baseline(baseline.lint_commit(base_sha, lint), index)
+    assert base.new_messages(lint()) == []
+
+
+def test_failed_base_lint_isnt_cached(monkeypatch, git_repo, commit, lint_args):
+    monkeypatch.setattr(linters, "linter_version", lambda *args: {"version": "1.0"})
+    base_sha = commit("a.py", "bad one\n")
+    index = diff.DiffIndex(git.diff_lines(base_sha, base_sha))
+    cache = lintcache.LintCache(str(git_repo.mkdir("cache")))
+    key = baseline.cache_key(base_sha, lint_args)
+
+    def lint_failing(failures):
+        failures.append("fakelint")
+        return lint()
+
+    baseline.load(base_sha, index, cache, key, lint_failing)
+    assert cache.get(key) is None
+
+    # and linter upgrades get a fresh baseline
+    monkeypatch.setattr(linters, "linter_version", lambda *args: {"version": "2.0"})
+    assert baseline.cache_key(base_sha, lint_args) != key
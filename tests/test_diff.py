@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import codecs
+import os.path
+
+from inlineplz.util import diff
+
+diff_path = os.path.join("tests", "testdata", "diff", "github.diff")
+
+
+def load_index():
+    with codecs.open(diff_path, encoding="utf-8", errors="replace") as inputfile:
+        return diff.DiffIndex(line.rstrip("\n") for line in inputfile)
+
+
+def test_added_line_positions():
+    index = load_index()
+    assert index.position("app.py", 2) == 3
+    assert index.position("app.py", 6) == 7
+    assert index.position("app.py", 31) == 16
+    assert index.position("app.py", 42) == 24
+    assert index.position("build/tool.py", 3) == 3
+    assert index.position("dashes.sql", 3) == 4
+    assert index.position("fresh.py", 1) == 1
+    assert index.position("fresh.py", 2) == 2
+    assert index.position("new_name.py", 10) == 5
+    assert index.position("noeol.txt", 3) == 5
+    assert index.position("noeol.txt", 4) == 6
+
+
+def test_unchanged_lines_have_no_position():
+    index = load_index()
+    assert index.position("app.py", 1) is None
+    assert index.position("app.py", 3) is None
+    assert index.position("app.py", 20) is None
+    assert index.position("docs/moved.md", 1) is None
+    assert index.position("logo.bin", 1) is None
+    assert index.position("gone.txt", 1) is None
+    assert index.position("not_in_diff.py", 1) is None
+
+
+def test_renames_and_hunks():
+    index = load_index()
+    assert index.renames() == {
+        "new_name.py": "old_name.py",
+        "docs/moved.md": "moved.md",
+    }
+    assert index.files["app.py"].hunks == [(1, 8, 1, 9), (27, 7, 28, 7), (38, 3, 39, 4)]
+    assert index.files["fresh.py"].source is None
+    assert "gone.txt" not in index.files
+
+
+def test_quoted_paths():
+    index = diff.DiffIndex(
+        [
+            'diff --git "a/caf\\303\\251.py" "b/caf\\303\\251.py"',
+            "index 1c943a9..27a7ea6 100644",
+            '--- "a/caf\\303\\251.py"',
+            '+++ "b/caf\\303\\251.py"',
+            "@@ -1 +1,2 @@",
+            " a",
+            "+b",
+        ]
+    )
+    assert index.position("café.py", 2) == 2
+
+
+def test_map_line():
+    index = load_index()
+    assert index.map_line("app.py", 1) == ("app.py", 1)
+    assert index.map_line("app.py", 2) is None
+    assert index.map_line("app.py", 6) == ("app.py", 7)
+    assert index.map_line("app.py", 9) == ("app.py", 10)
+    assert index.map_line("app.py", 30) is None
+    assert index.map_line("app.py", 31) == ("app.py", 32)
+    assert index.map_line("app.py", 40) == ("app.py", 41)
+    assert index.map_line("dashes.sql", 2) is None
+    assert index.map_line("dashes.sql", 3) == ("dashes.sql", 2)
+    assert index.map_line("moved.md", 4) == ("docs/moved.md", 4)
+    assert index.map_line("old_name.py", 7) == ("new_name.py", 7)
+    assert index.map_line("untouched.py", 12) == ("untouched.py", 12)
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import subprocess
+
+from inlineplz.util import git
+
+
+def clone(git_repo, tmpdir_factory, *options):
+    """Clone git_repo over file:// so that --depth is honoured, returning its URL."""
+    url = "file://" + str(git_repo)
+    path = tmpdir_factory.mktemp("clone")
+    subprocess.check_call(["git", "clone", "-q"] + list(options) + [url, str(path)])
+    return url, path
+
+
+def test_available_commit_isnt_fetched(git_repo, commit):
+    sha = commit("a.txt", "a\n")
+    # fetching from a missing remote would fail
+    assert git.fetch_commit("file:///nonexistent", sha) == ""
+
+
+def test_shallow_clones_fetch_one_commit(git_repo, commit, tmpdir_factory):
+    commit("a.txt", "a\n")
+    url, path = clone(git_repo, tmpdir_factory, "--depth=1")
+    parent = commit("a.txt", "b\n")
+    sha = commit("a.txt", "c\n")
+    with path.as_cwd():
+        assert git.is_shallow()
+        git.fetch_commit(url, sha)
+        assert git.has_commit(sha)
+        assert not git.has_commit(parent)
+
+
+def test_falls_back_to_fetching_the_remote(git_repo, commit, tmpdir_factory):
+    commit("a.txt", "a\n")
+    url, path = clone(git_repo, tmpdir_factory)
+    sha = commit("a.txt", "b\n")
+    commit("a.txt", "c\n")
+    with path.as_cwd():
+        # the original protocol only serves commits that a ref points at
+        subprocess.check_call(["git", "config", "protocol.version", "0"])
+        git.fetch_commit(url, sha)
+        assert git.has_commit(sha)
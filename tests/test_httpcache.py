@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import json
+import os
+from http.server import BaseHTTPRequestHandler
+
+import requests
+
+from inlineplz.util import httpcache
+
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+    hits = []
+
+    def do_GET(self):
+        body = json.dumps({"head": {"sha": "abc123"}}).encode("utf-8")
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.hits.append(304)
+            self.send_response(304)
+            self.send_header("ETag", '"v1"')
+            self.send_header("X-RateLimit-Remaining", "4999")
+            self.end_headers()
+            return
+
+        self.hits.append(200)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", '"v1"')
+        self.send_header("X-RateLimit-Remaining", "5000")
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def test_conditional_requests(serve, tmpdir):
+    url = serve(FakeAPIHandler) + "/repos/owner/repo/pulls/1"
+    session = requests.Session()
+    adapter = httpcache.install(session, str(tmpdir))
+    assert session.get(url).json() == {"head": {"sha": "abc123"}}
+
+    # a fresh session sharing the cache directory revalidates instead of refetching
+    session = requests.Session()
+    adapter = httpcache.install(session, str(tmpdir))
+    response = session.get(url)
+    assert response.status_code == 200
+    assert response.json() == {"head": {"sha": "abc123"}}
+    assert response.headers["X-RateLimit-Remaining"] == "4999"
+    assert FakeAPIHandler.hits == [200, 304]
+    assert (adapter.requests, adapter.saved) == (1, 1)
+
+
+def test_disk_cache_evicts_least_recently_used(tmpdir):
+    cache = httpcache.DiskCache(str(tmpdir), max_entries=2)
+    for age, key in enumerate(["a", "b"]):
+        cache.set(key, {"body": key})
+        os.utime(cache._filename(key), (age, age))
+    assert cache.get("a") == {"body": "a"}
+    cache.set("a", {"body": "a2"})
+    assert cache.get("b") == {"body": "b"}
+    os.utime(cache._filename("b"), (0, 0))
+    cache.set("c", {"body": "c"})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"body": "a2"}
+    assert cache.get("c") == {"body": "c"}
+    assert len(os.listdir(str(tmpdir))) == 2
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+from inlineplz import incremental
+from inlineplz import message
+from inlineplz.util import lintcache
+
+
+class FakeInterface(object):
+    def __init__(self, reviewed):
+        self.reviewed = reviewed
+
+    def reviewed_shas(self):
+        return iter(self.reviewed)
+
+
+def test_builds_on_previous_review(git_repo, commit, lint_args):
+    commit("a.txt", "a\n")
+    reviewed_sha = commit("b.txt", "b\n")
+    cache = lintcache.LintCache(str(git_repo.mkdir("cache")))
+    messages = message.Messages()
+    messages.add_messages(
+        [
+            ("a.txt", 1, "proselint: old a"),
+            ("b.txt", 1, "proselint: old b"),
+            ("b.txt", 1, "prospector: whole repo"),
+        ]
+    )
+    incremental.save(cache, reviewed_sha, lint_args, messages.get_messages())
+    head_sha = commit("b.txt", "b changed\n")
+
+    assert incremental.load(FakeInterface([]), head_sha, cache, lint_args) is None
+    unknown = FakeInterface(["0" * 40, reviewed_sha])
+    previous = incremental.load(unknown, head_sha, cache, lint_args)
+    assert previous.sha == reviewed_sha
+    assert previous.changed_files == {"b.txt"}
+    # only per-file linters' messages on unchanged files carry over
+    assert previous.carried_over() == [("a.txt", 1, "proselint: old a")]
+
+    head = message.Messages()
+    head.add_message("a.txt", 1, "prospector: new")
+    merged, carried = incremental.merge(head.get_messages(), previous.carried_over())
+    assert [(msg.path, msg.comments) for msg in merged] == [
+        ("a.txt", {"prospector: new", "proselint: old a"})
+    ]
+    assert len(carried) == 1
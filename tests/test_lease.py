@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import os
+import sys
+import threading
+import time
+
+import inlineplz.linters as linters
+from inlineplz.util import lease
+from inlineplz.util import system
+
+
+def test_newer_run_takes_over(tmpdir):
+    path = lease.lease_path(str(tmpdir), "https://github.com", "owner/repo", "7")
+    older = lease.Lease(path)
+    assert older.acquire()
+    assert not older.superseded()
+
+    newer = lease.Lease(path)
+    assert newer.acquire()
+    older.last_check = None
+    assert older.superseded()
+    assert not newer.superseded()
+
+    # only the holder removes the lease
+    older.release()
+    assert os.path.exists(path)
+    newer.release()
+    assert not os.path.exists(path)
+
+
+def test_paths_survive_changing_directories(monkeypatch, tmpdir):
+    with tmpdir.as_cwd():
+        path = lease.lease_path("leases", "https://github.com", "owner/repo", "7")
+        monkeypatch.setattr(system, "STOP_FILE", os.path.abspath(system.STOP_FILE_NAME))
+        tmpdir.join(system.STOP_FILE_NAME).write("")
+    assert path == os.path.join(str(tmpdir), "leases", os.path.basename(path))
+    with tmpdir.mkdir("worktree").as_cwd():
+        assert system.should_stop()
+
+
+def test_retried_old_commit_doesnt_take_over(git_repo, commit):
+    old_sha = commit("a.txt", "old\n")
+    new_sha = commit("a.txt", "new\n")
+    path = str(git_repo.join("pr.lease"))
+    assert lease.Lease(path, new_sha).acquire()
+    retried = lease.Lease(path, old_sha)
+    assert not retried.acquire()
+    assert retried.superseded()
+
+
+def test_watcher_kills_linters(monkeypatch, tmpdir):
+    monkeypatch.setattr(lease, "CHECK_INTERVAL", 0.05)
+    monkeypatch.setattr(system, "_stopping", threading.Event())
+    path = str(tmpdir.join("pr.lease"))
+    older = lease.Lease(path)
+    older.acquire()
+    watcher = lease.LeaseWatcher(older)
+    watcher.start()
+    try:
+        assert not system.should_stop()
+        threading.Timer(0.2, lambda: lease.Lease(path).acquire()).start()
+        start = time.time()
+        linters.run_command([sys.executable, "-c", "import time; time.sleep(30)"])
+        assert time.time() - start < 10
+        assert system.should_stop()
+    finally:
+        watcher.stop()
+    assert not system.should_stop()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import os
+import subprocess
+import sys
+
+from inlineplz import linters
+from inlineplz.util import git
+from inlineplz.util import lintcache
+
+
+def test_get_set(tmpdir):
+    cache = lintcache.LintCache(str(tmpdir))
+    key = lintcache.make_key("pylint", {"version": "2.0"})
+    assert cache.get(key) is None
+    cache.set(key, {"messages": [["a.py", 1, "pylint: bad"]]})
+    assert cache.get(key) == {"messages": [["a.py", 1, "pylint: bad"]]}
+    assert key != lintcache.make_key("pylint", {"version": "2.1"})
+
+
+def test_evicts_least_recently_used(tmpdir):
+    cache = lintcache.LintCache(str(tmpdir), max_entries=2)
+    for age, key in enumerate(["a", "b"]):
+        cache.set(key, {"messages": []})
+        os.utime(cache._filename(key), (age, age))
+    # reading a makes b the oldest
+    assert cache.get("a") is not None
+    cache.set("c", {"messages": []})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+def test_files_hash_and_dirty(tmpdir):
+    with tmpdir.as_cwd():
+        subprocess.check_call(["git", "init", "-q"])
+        tmpdir.join("a.py").write("x = 1\n")
+        tmpdir.join("b.txt").write("text\n")
+        assert git.is_dirty(["*.py"])
+        subprocess.check_call(["git", "add", "a.py", "b.txt"])
+        before = git.files_hash(["*.py"])
+
+        tmpdir.join("b.txt").write("changed\n")
+        subprocess.check_call(["git", "add", "b.txt"])
+        assert git.files_hash(["*.py"]) == before
+
+        tmpdir.join("a.py").write("x = 2\n")
+        assert git.is_dirty(["*.py"])
+        subprocess.check_call(["git", "add", "a.py"])
+        assert git.files_hash(["*.py"]) != before
+
+
+def test_memo_key_covers_implicit_configs(monkeypatch, tmpdir):
+    monkeypatch.setattr(linters, "linter_version", lambda *args: {"version": "1.0"})
+    config = linters.LINTERS["prospector"]
+    with tmpdir.as_cwd():
+        subprocess.check_call(["git", "init", "-q"])
+        subprocess.check_call(["git", "config", "user.email", "test@example.com"])
+        subprocess.check_call(["git", "config", "user.name", "test"])
+        tmpdir.join("a.py").write("x = 1\n")
+        tmpdir.mkdir("sub").join("setup.cfg").write("[pylint]\n")
+        subprocess.check_call(["git", "add", "-A"])
+        subprocess.check_call(["git", "commit", "-q", "-m", "init"])
+        before = linters.memo_key("prospector", config)
+        assert before
+
+        tmpdir.join("sub", "setup.cfg").write("[pylint]\ndisable = all\n")
+        assert linters.memo_key("prospector", config) is None
+
+        subprocess.check_call(["git", "commit", "-q", "-am", "config"])
+        assert linters.memo_key("prospector", config) not in (None, before)
+
+
+def test_memo_survives_installs(monkeypatch, tmpdir_factory, git_repo, commit):
+    monkeypatch.setattr(linters, "PREVIOUS_INSTALL_COMMANDS", [])
+    python = [sys.executable, "-c"]
+    monkeypatch.setitem(
+        linters.LINTERS,
+        "fakelint",
+        {
+            "install": [python + ["open('package-lock.json', 'w')"]],
+            "help": python + ["raise SystemExit(1)"],
+            "run": python + ["pass"],
+            "rundefault": python + ["pass"],
+            "dotfiles": [],
+            "language": "python",
+            "parser": None,
+        },
+    )
+    commit("a.py", "x = 1\n")
+    cache = lintcache.LintCache(str(tmpdir_factory.mktemp("cache")))
+    for _ in range(2):
+        # every build starts from a fresh checkout
+        linters.PREVIOUS_INSTALL_COMMANDS[:] = []
+        if git_repo.join("package-lock.json").check():
+            git_repo.join("package-lock.json").remove()
+        linters.lint(install=True, enabled_linters=["fakelint"], memo=cache)
+        assert git_repo.join("package-lock.json").check()
+    assert cache.hits == 1
@@ -3,6 +3,8 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 
 import os
+import sys
+import time
 
 import inlineplz.linters as linters
 
@@ -41,3 +43,125 @@ def test_dotfiles_exist():
     }
     test_config_path = os.path.join(os.getcwd(), "tests", "testdata", "linter_configs")
     assert linters.dotfiles_exist(test_config, test_config_path)
+
+
+def test_run_per_file_batches_stop_when():
+    test_config = {
+        "run": ["echo"],
+        "dotfiles": [],
+        "language": "all",
+        "concurrency": 1,
+    }
+    test_path = os.path.join(os.getcwd(), "tests", "testdata")
+    batches = []
+    for batch in linters.run_per_file_batches(
+        test_config,
+        path=test_path,
+        batch_size=1,
+        stop_when=lambda: len(batches) >= 1,
+    ):
+        batches.append(batch)
+    assert len(batches) == 1
+    assert len(batches[0]) == 1
+
+
+def test_per_file_timeouts_are_failures(monkeypatch, tmpdir):
+    monkeypatch.setattr(linters, "PER_FILE_TIMEOUT", 0.5)
+    run = [
+        sys.executable,
+        "-c",
+        "import sys, time; time.sleep(30 if 'slow' in sys.argv[1] else 0)",
+    ]
+    monkeypatch.setitem(
+        linters.LINTERS,
+        "fakelint",
+        {
+            "run": run,
+            "rundefault": run,
+            "dotfiles": [],
+            "language": "python",
+            "run_per_file": True,
+            "parser": None,
+        },
+    )
+    tmpdir.join("fast.py").write("x = 1\n")
+    tmpdir.join("slow.py").write("x = 1\n")
+    failures = []
+    with tmpdir.as_cwd():
+        assert not linters.lint(enabled_linters=["fakelint"], failures=failures)
+    assert failures == ["fakelint"]
+
+
+def test_shard_plan_covers_everything_once(monkeypatch, tmpdir):
+    for index in range(10):
+        tmpdir.join("file{}.txt".format(index)).write("content {}".format(index))
+    monkeypatch.setattr(
+        linters,
+        "LINTERS",
+        {
+            "slow": {"run_per_file": False},
+            "fast": {"run_per_file": False},
+            "perfile": {"run_per_file": True, "language": "all"},
+        },
+    )
+    durations = {"slow": 100, "fast": 10, "perfile": 50}
+    plans = [
+        linters.shard_plan(
+            ["slow", "fast", "perfile"], index, 3, [], str(tmpdir), durations
+        )
+        for index in (1, 2, 3)
+    ]
+    whole = sorted(
+        linter for plan in plans for linter, files in plan.items() if files is None
+    )
+    assert whole == ["fast", "slow"]
+    per_file = sorted(
+        os.path.basename(filepath)
+        for plan in plans
+        for filepath in plan.get("perfile") or []
+    )
+    assert per_file == sorted("file{}.txt".format(index) for index in range(10))
+    # the slow linter gets a shard to itself
+    assert plans[0] == {"slow": None}
+    assert plans == [
+        linters.shard_plan(
+            ["perfile", "fast", "slow"], index, 3, [], str(tmpdir), durations
+        )
+        for index in (1, 2, 3)
+    ]
+
+
+def test_native_cache(monkeypatch, tmpdir):
+    monkeypatch.setenv("INLINEPLZ_CACHE_DIR", str(tmpdir))
+    config = {
+        "run": ["lint"],
+        "rundefault": ["lint"],
+        "dotfiles": [],
+        "cache": {
+            "args": ["--cache", "{cache_dir}/lint.cache"],
+            "env": {"LINT_HOME": "{cache_dir}"},
+        },
+    }
+    cmd, env, path = linters.native_cache("lint", config)
+    assert path.startswith(str(tmpdir))
+    assert cmd == ["lint", "--cache", os.path.join(path, "lint.cache")]
+    assert env["LINT_HOME"] == path
+
+    # a config change gets a fresh cache and the old one is kept for a while
+    config["rundefault"] = ["lint", "--strict"]
+    _, _, new_path = linters.native_cache("lint", config)
+    assert new_path != path
+    assert os.path.isdir(new_path)
+    assert os.path.isdir(path)
+
+    # until it goes unused for long enough
+    old = time.time() - linters.NATIVE_CACHE_MAX_AGE - 1
+    os.utime(path, (old, old))
+    linters.native_cache("lint", config)
+    assert not os.path.exists(path)
+
+    assert linters.native_cache("lint", {"run": ["lint"], "dotfiles": []}) == (
+        ["lint"],
+        None,
+        None,
+    )
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import time
+
+from inlineplz import interfaces
+from inlineplz import linters
+from inlineplz import main
+from inlineplz import message
+from inlineplz.interfaces.base import InterfaceBase
+from inlineplz.util import system
+
+
+class ReviewArgs(object):
+    def __init__(self, **options):
+        self.url = None
+        self.repo_slug = "owner/repo"
+        self.owner = None
+        self.repo = None
+        self.dryrun = False
+        self.interface = "fake"
+        self.pull_request = 1
+        self.branch = None
+        self.token = None
+        self.tokens_file = None
+        self.commit = "abc123"
+        self.ignore_paths = []
+        self.prefix = "[inline-plz]"
+        self.batch_review = False
+        self.freshness_interval = 10
+        self.no_http_cache = True
+        self.partial_fetch = False
+        self.post_concurrency = 1
+        self.graphql = False
+        self.stream_comments = False
+        self.stop_at_max_comments = False
+        self.max_comments = 0
+        self.install = False
+        self.autorun = False
+        self.config_dir = None
+        self.enabled_linters = None
+        self.disabled_linters = None
+        self.no_linter_cache = True
+        self.zero_exit = False
+        self.delete_outdated = False
+        self.__dict__.update(options)
+
+
+class FakeInterface(InterfaceBase):
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        self.events = []
+        self.instances.append(self)
+
+    def is_valid(self):
+        return True
+
+    def start_review(self):
+        self.events.append("start")
+
+    def finish_review(self, success=True, error=False, truncated=False):
+        self.events.append(
+            ("finish", {"success": success, "error": error, "truncated": truncated})
+        )
+
+    def post_messages(self, messages, max_comments):
+        self.events.append(("post", sorted(msg.line_number for msg in messages)))
+        return len(messages)
+
+    def clear_outdated_messages(self):
+        self.events.append("clear")
+
+
+class StreamingInterface(FakeInterface):
+    def queue_messages(self, messages):
+        # slow enough that linting finishes first
+        time.sleep(0.1)
+        self.events.append(("queue", [msg.line_number for msg in messages]))
+        super(StreamingInterface, self).queue_messages(messages)
+
+
+class FailingStartInterface(FakeInterface):
+    def start_review(self):
+        raise RuntimeError("bad credentials")
+
+
+class InvalidInterface(FakeInterface):
+    def is_valid(self):
+        return False
+
+
+class FailingInitInterface(FakeInterface):
+    def __init__(self, *args, **kwargs):
+        raise RuntimeError("pull request not found")
+
+
+def make_messages(*lines):
+    messages = message.Messages()
+    for line in lines:
+        messages.add_message("app.py", line, "lint: line {}".format(line))
+    return messages.get_messages()
+
+
+def fake_lint(*linter_messages, **options):
+    """A linters.lint that runs one linter per item of linter_messages."""
+    runs = []
+    seconds = options.get("seconds", 0)
+
+    def lint(*args, **kwargs):
+        on_messages = kwargs.get("on_messages")
+        stop_when = kwargs.get("stop_when")
+        found = []
+        for messages in linter_messages:
+            if system.should_stop():
+                break
+
+            if stop_when and stop_when():
+                break
+
+            time.sleep(seconds)
+            runs.append(messages)
+            found.extend(messages)
+            if on_messages:
+                on_messages(messages)
+        return found
+
+    return lint, runs
+
+
+def run_review(monkeypatch, interface_class, lint, **options):
+    monkeypatch.setitem(interfaces.INTERFACES, "fake", interface_class)
+    monkeypatch.setattr(interface_class, "instances", [])
+    monkeypatch.setattr(linters, "lint", lint)
+    ret_code = main.review(ReviewArgs(**options), trusted=False)
+    return ret_code, interface_class.instances
+
+
+def test_setup_failure_reports_error(monkeypatch):
+    lint, _ = fake_lint(make_messages(1))
+    ret_code, instances = run_review(monkeypatch, FailingStartInterface, lint)
+    assert ret_code == 1
+    assert instances[0].events == [
+        ("finish", {"success": True, "error": True, "truncated": False})
+    ]
+
+
+def test_setup_failure_without_interface(monkeypatch):
+    lint, _ = fake_lint(make_messages(1))
+    ret_code, instances = run_review(monkeypatch, FailingInitInterface, lint)
+    assert ret_code == 1
+    assert instances == []
+
+
+def test_setup_failure_stops_linting(monkeypatch):
+    lint, runs = fake_lint(make_messages(1), make_messages(2), seconds=0.2)
+    ret_code, _ = run_review(monkeypatch, FailingInitInterface, lint)
+    assert ret_code == 1
+    # stopped at the latest by the linter after setup finished
+    assert len(runs) < 2
+    assert not system.should_stop()
+
+
+def test_invalid_review_stops_linting(monkeypatch):
+    lint, runs = fake_lint(make_messages(1), make_messages(2), seconds=0.2)
+    ret_code, instances = run_review(monkeypatch, InvalidInterface, lint)
+    assert ret_code == 0
+    assert len(runs) < 2
+    assert instances[0].events == []
+
+
+def test_setup_overlaps_linting(monkeypatch):
+    lint, _ = fake_lint(make_messages(1, 2))
+    ret_code, instances = run_review(monkeypatch, FakeInterface, lint)
+    assert ret_code == 1
+    assert instances[0].events == [
+        "start",
+        ("post", [1, 2]),
+        ("finish", {"success": False, "error": False, "truncated": False}),
+    ]
+
+
+def test_stream_drains_before_final_status(monkeypatch):
+    lint, _ = fake_lint(make_messages(1), make_messages(2, 3))
+    ret_code, instances = run_review(
+        monkeypatch, StreamingInterface, lint, stream_comments=True
+    )
+    assert ret_code == 1
+    assert instances[0].events == [
+        "start",
+        ("queue", [1]),
+        ("queue", [2, 3]),
+        ("post", [1, 2, 3]),
+        ("finish", {"success": False, "error": False, "truncated": False}),
+    ]
+
+
+def test_budget_stops_linting_with_truncated_status(monkeypatch):
+    lint, runs = fake_lint(make_messages(1, 2), make_messages(3))
+    ret_code, instances = run_review(
+        monkeypatch,
+        FakeInterface,
+        lint,
+        stop_at_max_comments=True,
+        max_comments=1,
+        delete_outdated=True,
+    )
+    assert ret_code == 1
+    assert len(runs) == 1
+    # comments from the skipped linter aren't outdated, so nothing is cleared
+    assert instances[0].events == [
+        "start",
+        ("post", [1, 2]),
+        ("finish", {"success": False, "error": False, "truncated": True}),
+    ]
+
+
+class FinishedSetup(object):
+    def __init__(self, interface):
+        self.interface = interface
+
+
+def test_review_with_failed_linters_isnt_saved(monkeypatch, tmpdir):
+    monkeypatch.setenv(system.CACHE_DIR_ENV, str(tmpdir))
+    saved = []
+    monkeypatch.setattr(main.incremental, "save", lambda *args: saved.append(args))
+    setup = FinishedSetup(FakeInterface())
+    setup.interface.last_sha = "abc123"
+    args = ReviewArgs(lint_cache=True)
+    main.save_review(args, setup, make_messages(1), None, ["fakelint"])
+    assert saved == []
+    main.save_review(args, setup, make_messages(1), None, [])
+    assert len(saved) == 1
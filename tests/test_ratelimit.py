@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import time
+
+from inlineplz.util import ratelimit
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, headers):
+        self.status_code = status_code
+        self.headers = headers
+
+
+class FakeError(Exception):
+    def __init__(self, code, headers, msg=""):
+        super(FakeError, self).__init__(msg)
+        self.code = code
+        self.msg = msg
+        self.response = FakeResponse(code, headers)
+
+
+def test_fast_while_budget_is_plentiful():
+    scheduler = ratelimit.RequestScheduler(min_interval=0.1, low_water=100)
+    scheduler.update(
+        FakeResponse(
+            200,
+            {
+                "X-RateLimit-Remaining": "4000",
+                "X-RateLimit-Reset": str(int(time.time()) + 3600),
+            },
+        )
+    )
+    assert scheduler.delay() == 0.1
+
+
+def test_slows_down_when_budget_is_low():
+    scheduler = ratelimit.RequestScheduler(min_interval=0.1, low_water=100)
+    scheduler.update(
+        FakeResponse(
+            200,
+            {
+                "X-RateLimit-Remaining": "10",
+                "X-RateLimit-Reset": str(int(time.time()) + 100),
+            },
+        )
+    )
+    assert 9 < scheduler.delay() <= 10
+
+
+def test_is_rate_limited():
+    scheduler = ratelimit.RequestScheduler()
+    assert scheduler.is_rate_limited(FakeError(429, {}))
+    assert scheduler.is_rate_limited(FakeError(403, {"Retry-After": "60"}))
+    assert scheduler.is_rate_limited(FakeError(403, {"X-RateLimit-Remaining": "0"}))
+    assert scheduler.is_rate_limited(
+        FakeError(403, {}, "You have exceeded a secondary rate limit.")
+    )
+    assert not scheduler.is_rate_limited(FakeError(403, {}, "Resource not accessible"))
+    assert not scheduler.is_rate_limited(FakeError(422, {"Retry-After": "60"}))
+
+
+def test_backoff_honors_retry_after(monkeypatch):
+    slept = []
+    monkeypatch.setattr(ratelimit.time, "sleep", slept.append)
+    scheduler = ratelimit.RequestScheduler()
+    scheduler.update(FakeResponse(403, {"Retry-After": "4"}))
+    scheduler.backoff(0)
+    assert 4 <= slept[0] <= 6
+    # Retry-After only applies once, then we fall back to exponential backoff
+    scheduler.backoff(3)
+    assert 8 <= slept[1] <= 12
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import os
+import threading
+
+import pytest
+
+from inlineplz import cacheserver
+from inlineplz.util import lintcache
+from inlineplz.util import remotecache
+
+KEY = "a" * 40
+OTHER_KEY = "b" * 40
+
+
+@pytest.fixture
+def server(tmpdir):
+    server = cacheserver.make_server(str(tmpdir.join("server")), "127.0.0.1", 0)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def server_url(server):
+    return "http://127.0.0.1:{0}/cache".format(server.server_address[1])
+
+
+def test_shares_entries_between_local_caches(server, tmpdir):
+    first = remotecache.RemoteCache(
+        server_url(server), local=lintcache.LintCache(str(tmpdir.mkdir("first")))
+    )
+    assert first.get(KEY) is None
+    first.set(KEY, {"messages": [["a.py", 1, "pylint: bad"]]})
+    assert first.bytes_up > 0
+
+    second_local = lintcache.LintCache(str(tmpdir.mkdir("second")))
+    second = remotecache.RemoteCache(server_url(server), local=second_local)
+    assert second.get(KEY) == {"messages": [["a.py", 1, "pylint: bad"]]}
+    assert second.remote_hits == 1
+    assert second.bytes_down == first.bytes_up
+    # the remote hit was stored locally
+    assert second.get(KEY) is not None
+    assert second.local_hits == 1
+
+
+def test_falls_back_to_local_cache(tmpdir):
+    cache = remotecache.RemoteCache(
+        "http://127.0.0.1:1", local=lintcache.LintCache(str(tmpdir)), timeout=1
+    )
+    cache.set(KEY, {"messages": []})
+    assert not cache.available
+    assert cache.get(KEY) == {"messages": []}
+    assert cache.get(OTHER_KEY) is None
+    assert cache.misses == 1
+
+
+def test_rejects_invalid_keys(server):
+    cache = remotecache.RemoteCache(server_url(server))
+    response = cache.session.get(server_url(server) + "/..%2f..%2fetc")
+    assert response.status_code == 400
+
+
+def test_store_evicts_least_recently_used(tmpdir):
+    store = cacheserver.CacheStore(str(tmpdir), max_size=10)
+    store.put(KEY, b"12345")
+    os.utime(os.path.join(str(tmpdir), KEY), (1, 1))
+    store.put(OTHER_KEY, b"12345")
+    os.utime(os.path.join(str(tmpdir), OTHER_KEY), (2, 2))
+    # reading KEY makes OTHER_KEY the oldest
+    assert store.get(KEY) == b"12345"
+    store.put("c" * 40, b"123")
+    assert store.get(OTHER_KEY) is None
+    assert store.get(KEY) == b"12345"
+    assert store.size == 8
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import gzip
+
+import pytest
+
+from inlineplz import message
+from inlineplz import results
+
+
+def make_messages():
+    messages = message.Messages()
+    messages.add_messages(
+        [
+            ("b.py", 2, "pylint: unused import"),
+            ("a.py", 10, "flake8: line too long"),
+            ("a.py", 10, "pylint: line too long"),
+        ]
+    )
+    return messages.get_messages()
+
+
+def test_round_trip(tmpdir):
+    path = str(tmpdir.join("results.jsonl.gz"))
+    results.write(path, make_messages(), {"commit": "abc123", "linters": {}})
+    with gzip.open(path, "rt") as results_file:
+        assert len(results_file.readlines()) == 3
+
+    metadata, messages = results.read(path)
+    assert metadata["commit"] == "abc123"
+    assert [(msg.path, msg.line_number) for msg in messages] == [
+        ("a.py", 10),
+        ("b.py", 2),
+    ]
+    assert messages[0].comments == {"flake8: line too long", "pylint: line too long"}
+
+
+def test_unsupported_format(tmpdir):
+    path = tmpdir.join("results.jsonl")
+    path.write('{"format_version": 99}\n')
+    with pytest.raises(ValueError):
+        results.read(str(path))
+
+
+def test_merge_shards(tmpdir):
+    first = str(tmpdir.join("shard1.jsonl.gz"))
+    second = str(tmpdir.join("shard2.jsonl.gz"))
+    results.write(
+        first,
+        make_messages(),
+        {"commit": "abc123", "shard": "1/2", "linters": {"pylint": {"seconds": 3}}},
+    )
+    other = message.Messages()
+    other.add_message("a.py", 10, "eslint: something else")
+    results.write(
+        second,
+        other.get_messages(),
+        {"commit": "abc123", "shard": "2/2", "linters": {"pylint": {"seconds": 4}}},
+    )
+    metadata, messages = results.merge([first, second])
+    assert metadata["commit"] == "abc123"
+    assert metadata["merged"] == ["1/2", "2/2"]
+    assert metadata["linters"]["pylint"]["seconds"] == 7
+    assert len(messages) == 2
+    merged = [msg for msg in messages if msg.path == "a.py"][0]
+    assert len(merged.comments) == 3
+
+    results.write(second, [], {"commit": "def456"})
+    with pytest.raises(ValueError):
+        results.merge([first, second])
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import time
+from http.server import BaseHTTPRequestHandler
+
+import requests
+
+from inlineplz.util import ratelimit
+from inlineplz.util import tokenpool
+
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+    quota = {}
+    seen = []
+
+    def do_GET(self):
+        token = self.headers.get("Authorization").split()[-1]
+        self.seen.append(token)
+        self.quota[token] -= 1
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.send_header("X-RateLimit-Remaining", str(self.quota[token]))
+        self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+        self.end_headers()
+
+
+def test_requests_go_to_the_token_with_most_quota(serve):
+    FakeAPIHandler.quota = {"low": 3, "high": 6}
+    url = serve(FakeAPIHandler) + "/rate_limit"
+    pool = tokenpool.TokenPool(["low", "high"])
+    session = requests.Session()
+    session.auth = tokenpool.TokenPoolAuth(pool)
+    for _ in range(6):
+        session.get(url)
+    # each token is tried once, then the one with more quota left gets the rest
+    # until they're even
+    assert FakeAPIHandler.seen == ["low", "high", "high", "high", "high", "low"]
+    assert pool.budget()[0] == 3
+    assert ratelimit.RequestScheduler(token_pool=pool).budget()[0] == 3
+
+
+def test_exhausted_pool_waits_for_earliest_reset(monkeypatch):
+    pool = tokenpool.TokenPool(["a", "b"])
+    now = time.time()
+    pool.states[0].remaining, pool.states[0].reset = 0, now + 100
+    pool.states[1].remaining, pool.states[1].reset = 0, now + 10
+    waits = []
+
+    def sleep(seconds):
+        waits.append(seconds)
+        pool.states[1].reset = now
+
+    monkeypatch.setattr(tokenpool.time, "sleep", sleep)
+    assert pool.acquire() == "b"
+    assert len(waits) == 1 and 9 < waits[0] <= 11
+
+
+def test_load_tokens(monkeypatch, tmpdir):
+    monkeypatch.setenv(tokenpool.TOKENS_ENV, "two, three")
+    tokens_file = tmpdir.join("tokens")
+    tokens_file.write("# shared CI tokens\nfour\n\nthree\n")
+    assert tokenpool.load_tokens("one", str(tokens_file)) == [
+        "one",
+        "two",
+        "three",
+        "four",
+    ]